@@ -1,19 +1,25 @@
 # Internal
 import datetime
+from contextlib import ExitStack
 from typing import Dict, List
 
 from src.models.connector import SqlServerConnection, ConnectionType
+from src.export.fetch import fetch_frame
+from src.export.query import QueryRegistry, query_params
+from src.export.transform import process_batch, empty_frame
+from src.export.writers import BatchWriter, OutputFormat, open_writer
+from src.export.parallel import ConnectionPool, parallel_stream_and_process_data
+from src.export.scheduler import multi_table_stream_and_process_data
+from src.export.pipeline import pipelined_stream_and_process_data, stream_range_and_process_data
+from src.export.windows import AdaptiveBatchSize
+from src.export.metrics import ExportMetrics, TableMetrics, stage
+from src.export.checkpoint import CheckpointManifest
 import traceback
-import pymssql
 import polars as pl
 import datetime as dt
-import zipfile
-import os
 
-# Initialize sql connection
+# Sql connection config, the connection itself is opened in run() so the module imports without a database
 conn_config = SqlServerConnection(ConnectionType.NewSkies)
-connection = pymssql.connect(f"{conn_config.uri + ':' + conn_config.port}", conn_config.user,
-                                           conn_config.pwd, conn_config.database)
 
 
 # List of Files to load
@@ -55,6 +61,12 @@ column_relationship = {
     "TreatmentDistinctRanked": "MinLoggedUTC"
 }
 
+# Qualified filter column as aliased in the RawSQLQueries, used when the date range filter is pushed into the sql
+time_predicate_relationship = {
+    "Treatment": "t.[LoggedUTC]",
+    "TreatmentDistinctRanked": "tdr.[MinLoggedUTC]"
+}
+
 data_types = {
     "Treatment": {
         "TreatmentID": pl.Int64,
@@ -234,8 +246,8 @@ def retrieve_and_process_data(cursor, sql_query, id_start, id_end, batch_size, d
         start_time = dt.datetime.now()
 
         # Execute query for current batch
-        cursor.execute(sql_query, (id_start, max_id))
-        rows = cursor.fetchall()
+        cursor.execute(sql_query, query_params(sql_query, (id_start, max_id), date_start, date_end))
+        res = fetch_frame(cursor, data_types)
         print(f'finish iteration {iter} start id: {id_start}; end id: {max_id}; '
               f'duration (minutes): {(dt.datetime.now() - start_time).total_seconds() / 60}')
 
@@ -243,11 +255,10 @@ def retrieve_and_process_data(cursor, sql_query, id_start, id_end, batch_size, d
 
         iter += 1
 
-        if not rows:
+        if res is None:
             continue
 
-        # Convert rows to DataFrame and merge with main DataFrame
-        res = pl.DataFrame(rows, schema=data_types)
+        # Merge with main DataFrame
         if res_df is None:
             res_df = res
         else:
@@ -255,45 +266,128 @@ def retrieve_and_process_data(cursor, sql_query, id_start, id_end, batch_size, d
 
     # Handle empty result
     if res_df is None or len(res_df) == 0:
-        res_df = pl.DataFrame({i: [] for i in data_types.keys()})
+        res_df = empty_frame(data_types)
 
-    # Apply column type casting
-    res_df = res_df.with_columns([pl.col(col).cast(dtype) for col, dtype in data_types.items()])
+    # Apply casting, date filtering and character stripping
+    res_df = process_batch(res_df, data_types, filter_column, date_start, date_end)
 
-    # Apply date filtering
-    res_df = res_df.filter((pl.col(filter_column) >= date_start) & (pl.col(filter_column) <= date_end))
+    return res_df
 
-    # Remove accessory filter column if it's the last one
-    if res_df.columns[-1] == filter_column:
-        res_df = res_df.drop([filter_column])
+# Retrieve, Process and Stream Data
+def stream_and_process_data(cursor, sql_query, id_start, id_end, batch_size, data_types, filter_column, date_start,
+                            date_end, writer: BatchWriter, controller: AdaptiveBatchSize = None,
+                            metrics: TableMetrics = None):
+    iter = 0
 
-    # Remove tab and newline characters
-    table_dtypes = dict(zip(res_df.columns, res_df.dtypes))
-    res_df = res_df.with_columns([
-        pl.col(col).str.replace_all(r"[\n\t]", " ") if table_dtypes[col] == pl.Utf8 else pl.col(col)
-        for col in res_df.columns
-    ])
+    # Fetch data in batches, process each one and append it straight to the sink
+    while id_start < id_end:
+        max_id = min(id_start + (controller.batch_size if controller is not None else batch_size), id_end)
+        window_metrics = metrics.window((id_start, max_id)) if metrics is not None else None
+        start_time = dt.datetime.now()
 
-    return res_df
+        # Execute query for current batch
+        with stage(window_metrics, "query"):
+            cursor.execute(sql_query, query_params(sql_query, (id_start, max_id), date_start, date_end))
+        res = fetch_frame(cursor, data_types, window_metrics=window_metrics)
+        duration = (dt.datetime.now() - start_time).total_seconds()
+        print(f'finish iteration {iter} start id: {id_start}; end id: {max_id}; '
+              f'duration (minutes): {duration / 60}')
 
-## Save and Zip data
-def save_and_zip_data(res_df, i, date_start, date_end, suffix=""):
-    # Define file paths
-    title_start, title_end = date_start.strftime("%Y-%m-%d"), date_end.strftime("%Y-%m-%d")
-    csv_path = f"./TreatmentExport/{i}/{i}_{title_start}_to_{title_end}{suffix}.csv"
-    zip_path = f"./TreatmentExport/{i}/{i}_{title_start}_to_{title_end}{suffix}.zip"
+        # Size the next window from this one
+        if controller is not None:
+            controller.observe((id_start, max_id), len(res) if res is not None else 0,
+                               res.estimated_size() if res is not None else 0, duration)
+            print(f'next batch size: {controller.batch_size}; rows per second: {controller.rows_per_second}')
+
+        id_start = min(max_id + 1, id_end)
 
-    # Save DataFrame as CSV
-    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-    res_df.write_csv(csv_path, separator=";", quote_style="necessary", include_header=True)
+        iter += 1
 
-    # Zip the CSV file
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(csv_path, os.path.basename(csv_path))
+        if res is not None:
+            with stage(window_metrics, "cast"):
+                res = process_batch(res, data_types, filter_column, date_start, date_end)
+            with stage(window_metrics, "write"):
+                writer.write(res)
+
+        if window_metrics is not None:
+            window_metrics.add(len(res) if res is not None else 0, res.estimated_size() if res is not None else 0)
+            window_metrics.emit()
+
+    # Handle empty result so the sink still carries the header
+    if writer.batches_written == 0:
+        writer.write(process_batch(empty_frame(data_types), data_types, filter_column, date_start, date_end))
+
+    return writer.rows_written
+
+# Stream every table for a day, one multi result set batch per id window
+def stream_all_tables(source, date_start, date_end, id_start, id_end, batch_size, output_format=OutputFormat.Csv,
+                      manifest: CheckpointManifest = None, time_filter=False, adaptive=False, id_end_logged=None,
+                      complete=True, metrics: ExportMetrics = None, pipeline=False, queries: QueryRegistry = None):
+    """
+    Streams every table for a day. With a manifest a rerun only pulls ids past each table's watermark into the next
+    _partN file, pass complete=False while the day is still being logged so later refreshes pick up from there. The
+    parts are combined into the day's file when it is recorded complete.
+    :param id_end_logged: LoggedUTC of id_end, kept with the watermark
+    :param queries: templates loaded once for the whole run, read from RawSQLQueries when not given
+    """
+    # Skip tables a previous run already finished for this day
+    tables = [i for i in treatment_files if manifest is None or not manifest.is_complete(i, date_start)]
+    if not tables:
+        print(f'skipping {date_start.strftime("%Y-%m-%d")}, already extracted')
+        return {}
+
+    # Nothing was logged past the watermark since the last refresh, a run stopped before recording its watermark
+    # falls back on the windows it completed. Ids are inclusive, but one id short of id_end counts as caught up since
+    # id_windows never opens a window that starts on id_end, keep the two in step
+    watermarks = {i: manifest.watermark(i, date_start) if manifest is not None else None for i in tables}
+    if manifest is not None and all((watermarks[i][0] if watermarks[i] is not None else
+                                     manifest.resume_from(i, date_start) or id_start - 1) >= id_end - 1
+                                    for i in tables):
+        logged = max((watermark[1] for watermark in watermarks.values() if watermark is not None and watermark[1]),
+                     default=None)
+        print(f'skipping {date_start.strftime("%Y-%m-%d")}, no ids past the watermark {id_end}'
+              + (f' logged {logged}' if logged is not None else ''))
+        return {}
+
+    # Flatten and inverse filter relationship input
+    table_filter_lookup = cross_join_inverse(filter_relationship)
+    queries = queries if queries is not None else QueryRegistry(data_types)
+    sql_queries, filter_columns = {}, {}
+    for i in tables:
+        sql_queries[i] = queries.query(i, time_predicate_relationship[table_filter_lookup[i]] if time_filter else None)
+        filter_columns[i] = column_relationship[table_filter_lookup[i]]  # Final  Date Range Filter Column
+
+    print(f'pulling {", ".join(tables)} for {date_start.strftime("%Y-%m-%d")}')
+
+    # Writers are closed on the way out of an exception too, so windows already recorded stay readable
+    with ExitStack() as stack:
+        writers = {i: stack.enter_context(manifest.open_writer(i, date_start, date_end, output_format)
+                                          if manifest is not None else
+                                          open_writer(i, date_start, date_end, output_format=output_format))
+                   for i in tables}
+        rows = multi_table_stream_and_process_data(source, sql_queries, id_start, id_end, batch_size, data_types,
+                                                   filter_columns, date_start, date_end, writers, manifest,
+                                                   AdaptiveBatchSize(batch_size) if adaptive else None, metrics,
+                                                   pipeline)
+
+    # Compression ratio of each closed output
+    if metrics is not None:
+        for i in tables:
+            metrics.table(i, date_start).file(writers[i])
+
+    if manifest is not None:
+        for i in tables:
+            manifest.record_watermark(i, date_start, id_end, id_end_logged)
+            if complete:
+                manifest.record_complete(i, date_start)
+
+    return rows
 
-    # Remove the original CSV file
-    if os.path.exists(csv_path):
-        os.remove(csv_path)
+## Save and Zip data
+def save_and_zip_data(res_df, i, date_start, date_end, suffix="", output_format=OutputFormat.Csv):
+    # Written in a single pass, csv goes straight into the zip entry
+    with open_writer(i, date_start, date_end, suffix, output_format) as writer:
+        writer.write(res_df)
 
 # Process and Split Data
 def process_data_with_split(cursor, sql_query, id_start, id_end, batch_size, data_types, filter_column, date_start, date_end, i):
@@ -322,20 +416,41 @@ def run():
     time_column = "LoggedUTC"
 
     split = False
-    cursor = connection.cursor(as_dict=True)
+    stream = True  # Stream each batch to the output sink instead of holding the whole day in memory
+    output_format = OutputFormat.Csv  # Zipped csv, Parquet or Arrow IPC
+    workers = 1  # Parallel connections when streaming, keep low to stay under the ODS rate limits
+    multi_table = True  # Pull every table per id window in one batch, only applies when streaming
+    checkpoint = True  # Record finished windows so a rerun resumes instead of starting over, multi_table only
+    time_filter = True  # Push the date range filter into the sql, the polars filter then only verifies
+    adaptive = True  # Size each id window from the last ones' latency and memory, batch_size is the starting size
+    metrics = ExportMetrics()  # Per table and id window stage timings as JSON lines, None to turn off
+    pipeline = True  # Overlap fetch, transform and write through bounded queues on a single connection
+    single_query = False  # One query per table and day read in fetchmany chunks, no id windows, needs multi_table off
+    prepared = True  # Run the templates through sp_executesql so SQL Server reuses one plan across windows and days
+    manifest = CheckpointManifest() if checkpoint else None
+    # Templates are read and checked against data_types once, not per table and day
+    queries = QueryRegistry(data_types, prepared=prepared)
+    # Initialize sql connection
+    connection = conn_config.connect()
+    cursor = connection.cursor(as_dict=False)
+    pool = ConnectionPool(conn_config, workers) if stream and workers > 1 else None
 
     try:
         # Read Csv
         date_batches = pl.read_csv("target_date_time_ranges_japan.csv", schema=date_load_schema)
         for items in date_batches.filter((pl.col("start") >= batch_start) & (pl.col("start") <= batch_end)).to_dicts():
+            if stream and multi_table:
+                stream_all_tables(pool if pool is not None else cursor, items["start"], items["end"],
+                                  items["logged_start_id"], items["logged_end_id"], 100000, output_format, manifest,
+                                  time_filter, adaptive, metrics=metrics, pipeline=pipeline, queries=queries)
+                continue
+
             # Flatten and inverse filter relationship input
             table_filter_lookup = cross_join_inverse(filter_relationship)
             for i in treatment_files:
-                with open(f"./src/RawSQLQueries/{i}.sql") as file:
-                    sql_query = file.read()
-
                 # Get Filter key
                 filter_key = table_filter_lookup[i]  # id lookup key
+                sql_query = queries.query(i, time_predicate_relationship[filter_key] if time_filter else None)
                 date_start = items["start"]  # Final Date Range Filter
                 date_end = items["end"]  # Final Date Range Filter
                 id_start = items["logged_start_id"]   # SQL Indexed Filter
@@ -345,10 +460,36 @@ def run():
                 print(f'pulling {i} for {date_start.strftime("%Y-%m-%d")}')
 
                 batch_size = 100000
-                if not split:
+                controller = AdaptiveBatchSize(batch_size) if adaptive else None
+                table_metrics = metrics.table(i, date_start) if metrics is not None else None
+                if stream:
+                    if pool is not None:
+                        with open_writer(i, date_start, date_end, output_format=output_format) as writer:
+                            parallel_stream_and_process_data(pool, sql_query, id_start, id_end, batch_size,
+                                                             data_types[i], filter_column, date_start, date_end,
+                                                             writer, controller, table_metrics)
+                    elif single_query:
+                        with open_writer(i, date_start, date_end, output_format=output_format) as writer:
+                            stream_range_and_process_data(cursor, sql_query, id_start, id_end, data_types[i],
+                                                          filter_column, date_start, date_end, writer, table_metrics)
+                    elif pipeline:
+                        with open_writer(i, date_start, date_end, output_format=output_format) as writer:
+                            pipelined_stream_and_process_data(cursor, sql_query, id_start, id_end, batch_size,
+                                                              data_types[i], filter_column, date_start, date_end,
+                                                              writer, controller, table_metrics)
+                    else:
+                        with open_writer(i, date_start, date_end, output_format=output_format) as writer:
+                            stream_and_process_data(cursor, sql_query, id_start, id_end, batch_size, data_types[i],
+                                                    filter_column, date_start, date_end, writer, controller,
+                                                    table_metrics)
+                    # Compression ratio of the closed output
+                    if table_metrics is not None:
+                        table_metrics.file(writer)
+                elif not split:
                     res_df_first_half = retrieve_and_process_data(cursor, sql_query, id_start, id_end, batch_size,
                                                                   data_types[i], filter_column, date_start, date_end)
-                    save_and_zip_data(res_df_first_half, i, date_start, date_end, suffix="")
+                    save_and_zip_data(res_df_first_half, i, date_start, date_end, suffix="",
+                                      output_format=output_format)
                 else:
                     process_data_with_split(cursor, sql_query, id_start,id_end, batch_size,
                                             data_types[i], filter_column, date_start, date_end, i)
@@ -359,12 +500,16 @@ def run():
         # Clean up connection to prevent rate limit
         cursor.close()
         connection.close()
+        if pool is not None:
+            pool.close()
 
 
     # Close Cursor
     cursor.close()
     # Close Connection
     connection.close()
+    if pool is not None:
+        pool.close()
 
 
 
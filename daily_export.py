@@ -10,6 +10,19 @@ import apo_extract_script
 # Date Target
 date_target = dt.datetime(year=2025, month=1, day=18)  # Date to export
 split = False # Split
+stream = True  # Stream each batch to the output sink instead of holding the whole day in memory
+output_format = apo_extract_script.OutputFormat.Csv  # Zipped csv, Parquet or Arrow IPC
+workers = 1  # Parallel connections when streaming, keep low to stay under the ODS rate limits
+multi_table = True  # Pull every table per id window in one batch, only applies when streaming
+checkpoint = True  # Record finished windows so a rerun resumes instead of starting over, multi_table only
+time_filter = True  # Push the date range filter into the sql, the polars filter then only verifies
+adaptive = True  # Size each id window from the last ones' latency and memory, batch_size is the starting size
+incremental = False  # Intraday refresh, only pull ids past the last exported watermark, multi_table only
+# Each refresh adds a _partN file, the parts are combined into the day's file once the day is recorded complete
+metrics = apo_extract_script.ExportMetrics()  # Per table and id window stage timings as JSON lines, None to turn off
+pipeline = True  # Overlap fetch, transform and write through bounded queues on a single connection
+single_query = False  # One query per table and day read in fetchmany chunks, no id windows, needs multi_table off
+prepared = True  # Run the templates through sp_executesql so SQL Server reuses one plan across windows
 # -------------------------------------------------------------------------------------------------------------------- #
 # Prep Variables
 _start = date_target - dt.timedelta(hours=1)
@@ -30,23 +43,14 @@ id_column = "TreatmentID"
 time_column = "LoggedUTC"
 look_up_object = IdLookUp()
 
-# Get Start id and corresponding startid datetime
-print("extracting for start time: ", _start)
-logged_start_id, logged_start_datetime = look_up_object.find_id_based_on_time(
+# Start and end id with their logged datetimes, served from the shared time index in ./data/time_index
+logged_start_id, logged_start_datetime, logged_end_id, logged_end_datetime = look_up_object.id_bounds(
     cursor,
     _start,
-    table_name,
-    id_column,
-    time_column, "before", None, None
-)
-start_id = logged_start_id # Forward Catch
-print("extracting for end time: ", _end)
-logged_end_id, logged_end_datetime = look_up_object.find_id_based_on_time(
-    cursor,
     _end,
     table_name,
     id_column,
-    time_column, "after", start_id, None
+    time_column
 )
 
 id_look_up_report = {
@@ -65,12 +69,22 @@ print(id_look_up_report)
 
 # Flatten and inverse filter relationship input
 table_filter_lookup = apo_extract_script.cross_join_inverse(apo_extract_script.filter_relationship)
-for i in apo_extract_script.treatment_files:
-    with open(f"./src/RawSQLQueries/{i}.sql") as file:
-        sql_query = file.read()
-
+# Templates are read and checked against data_types once
+queries = apo_extract_script.QueryRegistry(apo_extract_script.data_types, prepared=prepared)
+pool = apo_extract_script.ConnectionPool(conn_config, workers) if stream and workers > 1 else None
+if stream and multi_table:
+    apo_extract_script.stream_all_tables(pool if pool is not None else cursor, id_look_up_report["start"],
+                                         id_look_up_report["end"], id_look_up_report["logged_start_id"],
+                                         id_look_up_report["logged_end_id"], 100000, output_format,
+                                         apo_extract_script.CheckpointManifest() if checkpoint or incremental else None,
+                                         time_filter, adaptive, id_look_up_report["logged_end_datetime"],
+                                         # Day stays open for later refreshes until ids past its padded end exist
+                                         not incremental or id_look_up_report["logged_end_datetime"] >= _end,
+                                         metrics, pipeline, queries)
+for i in ([] if stream and multi_table else apo_extract_script.treatment_files):
     # Get Filter key
     filter_key = table_filter_lookup[i]  # id lookup key
+    sql_query = queries.query(i, apo_extract_script.time_predicate_relationship[filter_key] if time_filter else None)
     date_start = id_look_up_report["start"]  # Final Date Range Filter
     date_end = id_look_up_report["end"]  # Final Date Range Filter
     id_start = id_look_up_report["logged_start_id"]  # SQL Indexed Filter
@@ -80,10 +94,42 @@ for i in apo_extract_script.treatment_files:
     print(f'pulling {i} for {date_start.strftime("%Y-%m-%d")}')
 
     batch_size = 100000
-    if not split:
+    controller = apo_extract_script.AdaptiveBatchSize(batch_size) if adaptive else None
+    table_metrics = metrics.table(i, date_start) if metrics is not None else None
+    if stream:
+        if pool is not None:
+            with apo_extract_script.open_writer(i, date_start, date_end, output_format=output_format) as writer:
+                apo_extract_script.parallel_stream_and_process_data(pool, sql_query, id_start, id_end, batch_size,
+                                                                    apo_extract_script.data_types[i], filter_column,
+                                                                    date_start, date_end, writer, controller,
+                                                                    table_metrics)
+        elif single_query:
+            with apo_extract_script.open_writer(i, date_start, date_end, output_format=output_format) as writer:
+                apo_extract_script.stream_range_and_process_data(cursor, sql_query, id_start, id_end,
+                                                                 apo_extract_script.data_types[i], filter_column,
+                                                                 date_start, date_end, writer, table_metrics)
+        elif pipeline:
+            with apo_extract_script.open_writer(i, date_start, date_end, output_format=output_format) as writer:
+                apo_extract_script.pipelined_stream_and_process_data(cursor, sql_query, id_start, id_end, batch_size,
+                                                                     apo_extract_script.data_types[i], filter_column,
+                                                                     date_start, date_end, writer, controller,
+                                                                     table_metrics)
+        else:
+            with apo_extract_script.open_writer(i, date_start, date_end, output_format=output_format) as writer:
+                apo_extract_script.stream_and_process_data(cursor, sql_query, id_start, id_end, batch_size,
+                                                           apo_extract_script.data_types[i], filter_column, date_start,
+                                                           date_end, writer, controller, table_metrics)
+        # Compression ratio of the closed output
+        if table_metrics is not None:
+            table_metrics.file(writer)
+    elif not split:
         res_df_first_half = apo_extract_script.retrieve_and_process_data(cursor, sql_query, id_start, id_end, batch_size,
                                                       apo_extract_script.data_types[i], filter_column, date_start, date_end)
-        apo_extract_script.save_and_zip_data(res_df_first_half, i, date_start, date_end, suffix="")
+        apo_extract_script.save_and_zip_data(res_df_first_half, i, date_start, date_end, suffix="",
+                                             output_format=output_format)
     else:
         apo_extract_script.process_data_with_split(cursor, sql_query, id_start, id_end, batch_size,
-                                apo_extract_script.data_types[i], filter_column, date_start, date_end, i)
\ No newline at end of file
+                                apo_extract_script.data_types[i], filter_column, date_start, date_end, i)
+
+if pool is not None:
+    pool.close()
@@ -1,11 +1,11 @@
 # Internal
-import time
 import traceback
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 from pymssql import Cursor
 
 from src.models.connector import SqlServerConnection, ConnectionType
+from src.export.time_index import TimeIndex
 
 import datetime as dt
 import pymssql
@@ -18,6 +18,18 @@ connection = pymssql.connect(f"{conn_config.uri + ':' + conn_config.port}", conn
 
 
 class IdLookUp:
+    # Probe at most this many ids per lookup before settling for the closest match
+    max_probes: int = 64
+    # Target margin around the requested time in seconds
+    margin: int = 300
+    # Once the bracket is this narrow the exact id is read from SQL Server in one query
+    refine_threshold: int = 5000
+
+    def __init__(self, persist: bool = True):
+        self._persist = persist
+        self._indexes: Dict[Tuple[str, str, str], TimeIndex] = {}
+        self._min_max: Dict[Tuple[str, str], Tuple[int, int]] = {}
+
     # Helper functions ---------------------------------------------------------------------------------------------- //
     # Get the min and max of the ID column from the table
     @staticmethod
@@ -33,7 +45,7 @@ class IdLookUp:
     def get_time_by_id(target_cursor: Cursor, target_id: str, target_table: str, target_id_col: str,
                        target_time_col: str):
         query = f"SELECT TOP(1) {target_id_col}, {target_time_col} FROM {target_table} " \
-                f"WHERE {target_id_col} >= %s"
+                f"WHERE {target_id_col} >= %s ORDER BY {target_id_col}"
         target_cursor.execute(query, str(target_id))
         result = target_cursor.fetchone()
         print(result)
@@ -42,74 +54,160 @@ class IdLookUp:
         else:
             return None
 
+    # Anchor cache for a table, loaded once per lookup object
+    def _index(self, target_table: str, target_id_col: str, target_time_col: str) -> TimeIndex:
+        key = (target_table, target_id_col, target_time_col)
+        if key not in self._indexes:
+            self._indexes[key] = TimeIndex(target_table, target_id_col, target_time_col)
+        return self._indexes[key]
+
+    # Table bounds, only queried when the anchor cache can't bracket the target
+    def _table_bounds(self, target_cursor: Cursor, target_table: str, target_id_col: str, target_time_col: str):
+        key = (target_table, target_id_col)
+        if key not in self._min_max:
+            self._min_max[key] = self.get_min_max_id(target_cursor, target_table, target_id_col)
+        min_id, max_id = self._min_max[key]
+        return self.get_time_by_id(target_cursor, min_id, target_table, target_id_col, target_time_col), \
+            self.get_time_by_id(target_cursor, max_id, target_table, target_id_col, target_time_col)
+
+    # Exact id on the requested side of the target inside a narrow bracket
+    def _refine(self, target_cursor: Cursor, lower, upper, target_time, target_table, target_id_col, target_time_col,
+                direction):
+        if direction == 'before':
+            query = f"SELECT TOP(1) {target_id_col}, {target_time_col} FROM {target_table} " \
+                    f"WHERE {target_id_col} >= %s AND {target_id_col} <= %s AND {target_time_col} < %s " \
+                    f"ORDER BY {target_id_col} DESC"
+        else:
+            query = f"SELECT TOP(1) {target_id_col}, {target_time_col} FROM {target_table} " \
+                    f"WHERE {target_id_col} >= %s AND {target_id_col} <= %s AND {target_time_col} > %s " \
+                    f"ORDER BY {target_id_col}"
+        target_cursor.execute(query, (lower[0], upper[0], target_time))
+        result = target_cursor.fetchone()
+        print(result)
+        return None if result is None else (result[0], result[1])
+
+    def _within_margin(self, logged_time, target_time, direction) -> bool:
+        diff = (target_time - logged_time).total_seconds() if direction == 'before' \
+            else (logged_time - target_time).total_seconds()
+        return 0 < diff < self.margin
+
     # Find id based on time
     def find_id_based_on_time(self, target_cursor: Cursor, target_time, target_table, target_id_col, target_time_col,
-                              direction="before", start_id: Optional[int] = None, start_step: Optional[int] = None):
-        min_id, max_id = self.get_min_max_id(target_cursor, target_table, target_id_col)
-        current_id = (min_id + max_id) // 2 if start_id is None else start_id  # Set Initial ID
-        closest_id = None
-        closest_time = None
-        closest_diff = None
-        search_step = (max_id - min_id) // 4 if start_step is None else start_step  # Initial search step
+                              direction="before", start_id: Optional[int] = None):
+        """
+        Interpolation search for an id logged within 5 minutes before (or after) the target time. The id is treated
+        as roughly monotonic in the logged time, every probe is kept as an anchor so later lookups start from a
+        tight bracket.
+        :return: (id, logged time) of the match, or the closest id on the requested side
+        """
+        index = self._index(target_table, target_id_col, target_time_col)
+        lower, upper = index.bracket(target_time)
+        if lower is None or upper is None:
+            table_lower, table_upper = self._table_bounds(target_cursor, target_table, target_id_col,
+                                                          target_time_col)
+            lower, upper = lower or table_lower, upper or table_upper
+            for anchor in (lower, upper):
+                index.add(*anchor)
+
+        # Caller hint, usually the id found for the previous day
+        probe_id = start_id if start_id is not None and lower[0] < start_id < upper[0] else None
+        # Probes stay below ceiling, no ids exist from there up to the upper anchor
+        ceiling = upper[0]
+        last_width = None
         counter = 0
 
-        while min_id <= max_id:
+        while ceiling - lower[0] > self.refine_threshold and counter < self.max_probes:
             counter += 1
-            print("current_iter: ", counter, "id: ", current_id, " search_step: ", search_step)
-            closest_id_result, logged_time = self.get_time_by_id(target_cursor, current_id, target_table, target_id_col,
-                                                          target_time_col)
-            time.sleep(1)
+            width = ceiling - lower[0]
+            if probe_id is None:
+                # Interpolate on time, fall back to bisection when the last step barely narrowed the bracket
+                span = (upper[1] - lower[1]).total_seconds()
+                if (last_width is not None and width > last_width // 2) or span <= 0:
+                    probe_id = lower[0] + width // 2
+                else:
+                    probe_id = lower[0] + int((upper[0] - lower[0]) * (target_time - lower[1]).total_seconds() / span)
+            current_id = min(max(probe_id, lower[0] + 1), ceiling - 1)
+            probe_id, last_width = None, width
 
-            if logged_time is None or closest_id_result is None:
+            print("current_iter: ", counter, "id: ", current_id, " bracket: ", lower[0], "-", upper[0])
+            result = self.get_time_by_id(target_cursor, current_id, target_table, target_id_col, target_time_col)
+
+            if result is None or result[0] >= upper[0]:
+                # No ids between the probe and the upper anchor, which keeps its observed id and time
                 print(f"ID {current_id} does not exist. Adjusting search range...")
-                # current_id = closest_id
-                if current_id < min_id:
-                    current_id = min_id
-                elif current_id > max_id:
-                    current_id = max_id
+                ceiling = current_id
                 continue
 
+            closest_id_result, logged_time = result
+            index.add(closest_id_result, logged_time)
+
             # Check if logged_time is within the margin of 5 minutes based on the specified direction
-            if direction == 'before' and ((target_time - logged_time).total_seconds() < 300) \
-                    and ((target_time - logged_time).total_seconds() > 0):
-                print(f"Closest ID {closest_id_result} is within 5 minutes after the target time.")
-                return closest_id_result, logged_time  # Exit if within margin before target
-            elif direction == 'after' and ((logged_time - target_time).total_seconds() < 300) \
-                    and ((logged_time - target_time).total_seconds() > 0):
-                print(f"Closest ID {closest_id_result} is within 5 minutes before the target time.")
-                return closest_id_result, logged_time  # Exit if within margin after target
-
-            # Time difference
-            time_diff = abs((logged_time - target_time)).total_seconds()
-
-            # Check if this is the closest match
-            if closest_diff is None or time_diff < closest_diff:
-                if (direction == 'before' and logged_time <= target_time) \
-                        or (direction == 'after' and logged_time >= target_time):
-                    closest_diff = time_diff
-                    closest_id = closest_id_result
-                    closest_time = logged_time
-
-            # Adjust the search direction based on the comparison
+            if self._within_margin(logged_time, target_time, direction):
+                print(f"Closest ID {closest_id_result} is within 5 minutes {direction} the target time.")
+                self._save(index)
+                return closest_id_result, logged_time
+
+            # Adjust the search bracket based on the comparison
             if logged_time < target_time:
-                if direction == 'before':
-                    closest_id = current_id
-                    closest_time = logged_time
-                min_id = current_id + 1  # Move search upwards
-                current_id = min([current_id + search_step, max_id])
+                lower = (closest_id_result, logged_time)
             elif logged_time > target_time:
-                if direction == 'after':
-                    closest_id = current_id
-                    closest_time = logged_time
-                max_id = current_id - 1  # Move search downwards
-                current_id = max([current_id - search_step, min_id])
+                upper = (closest_id_result, logged_time)
+                ceiling = closest_id_result
             else:
+                self._save(index)
                 return closest_id_result, logged_time  # Exact match
 
-            # Reduce Search step as we get close to the target
-            search_step = max(1, search_step // 2)
+        # Bracket is narrow enough, read the exact id
+        result = self._refine(target_cursor, lower, upper, target_time, target_table, target_id_col, target_time_col,
+                              direction)
+        if result is None:
+            # Nothing on the requested side inside the bracket, closest anchor instead
+            self._save(index)
+            return lower if direction == 'before' else upper
+        index.add(*result)
+        self._save(index)
+        return result
+
+    # Sample anchors across an id range in one round trip, densifies the index for later lookups
+    def sample_range(self, target_cursor: Cursor, start_id: int, end_id: int, target_table, target_id_col,
+                     target_time_col, samples: int = 48):
+        index = self._index(target_table, target_id_col, target_time_col)
+        probe_ids = index.sample_ids(start_id, end_id, samples)
+        if not probe_ids:
+            return
+
+        values = ", ".join(["(%s)"] * len(probe_ids))
+        query = f"SELECT x.{target_id_col}, x.{target_time_col} FROM (VALUES {values}) s(id) " \
+                f"CROSS APPLY (SELECT TOP(1) {target_id_col}, {target_time_col} FROM {target_table} " \
+                f"WHERE {target_id_col} >= s.id ORDER BY {target_id_col}) x"
+        target_cursor.execute(query, tuple(probe_ids))
+        for anchor_id, logged in target_cursor.fetchall():
+            index.add(anchor_id, logged)
+        self._save(index)
+
+    def id_bounds(self, target_cursor: Cursor, start_time, end_time, target_table, target_id_col, target_time_col,
+                  start_id: Optional[int] = None, samples: int = 48):
+        """
+        ID bounds for a time range, answered from the sparse index and refined against SQL Server. The range found is
+        sampled back into the index so neighbouring days start from a tight bracket.
+        :return: (start id, start id logged time, end id, end id logged time)
+        """
+        print("extracting for start time: ", start_time)
+        logged_start_id, logged_start_datetime = self.find_id_based_on_time(
+            target_cursor, start_time, target_table, target_id_col, target_time_col, "before", start_id
+        )
+        print("extracting for end time: ", end_time)
+        logged_end_id, logged_end_datetime = self.find_id_based_on_time(
+            target_cursor, end_time, target_table, target_id_col, target_time_col, "after", logged_start_id
+        )
+        self.sample_range(target_cursor, logged_start_id, logged_end_id, target_table, target_id_col,
+                          target_time_col, samples)
 
-        return closest_id, closest_time
+        return logged_start_id, logged_start_datetime, logged_end_id, logged_end_datetime
+
+    def _save(self, index: TimeIndex):
+        if self._persist:
+            index.save()
 
 
 def run():
@@ -137,25 +235,14 @@ def run():
             start_time = dt.datetime.combine(date, dt.datetime.min.time())
             end_time = dt.datetime.combine(date, dt.datetime.max.time())
 
-            print("extracting for start time: ", start_time - dt.timedelta(hours=1))
-
-            # Get Start id and corresponding startid datetime
-            logged_start_id, logged_start_datetime = look_up_object.find_id_based_on_time(
+            # Get start and end id with their logged datetimes, samples the day back into the time index
+            logged_start_id, logged_start_datetime, logged_end_id, logged_end_datetime = look_up_object.id_bounds(
                 cursor,
                 start_time - dt.timedelta(hours=1),
-                table_name,
-                id_column,
-                time_column, "before", start_id, 100000000 if start_id is not None else None
-            )
-            print("extracting for end time: ", end_time + dt.timedelta(hours=1))
-            start_id = logged_start_id
-            # Get Start id and corresponding startid datetime
-            logged_end_id, logged_end_datetime = look_up_object.find_id_based_on_time(
-                cursor,
                 end_time + dt.timedelta(hours=1),
                 table_name,
                 id_column,
-                time_column, "after", start_id, 100000000 if start_id is not None else None
+                time_column, start_id
             )
             start_id = logged_end_id
 
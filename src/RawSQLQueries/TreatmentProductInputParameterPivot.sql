@@ -6,7 +6,7 @@ SELECT
 	  ,NULL AS [FareClassID] -- Not Found Dummy Column
 	  ,NULL AS [ProbabilityMatch] -- Not Found Dummy Column
 	  ,NULL AS [BookingWeekday] -- Not Found Dummy Column
-	  ,NULL AS [output_labellID] -- Not Found Dummy Column
+	  ,NULL AS [output_label1ID] -- Not Found Dummy Column
 	  ,NULL AS [BookingWeekdayID] -- Not Found Dummy Column
 	  ,NULL AS [LabelMatch] -- Not Found Dummy Column
 	  ,NULL AS [LineOfBusiness] -- Not Found Dummy Column
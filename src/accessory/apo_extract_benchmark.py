@@ -0,0 +1,304 @@
+# Internal
+import datetime as dt
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import polars as pl
+
+import apo_extract_script
+from src.export.metrics import ExportMetrics
+from src.export.pipeline import pipelined_stream_and_process_data, stream_range_and_process_data
+from src.export.query import TIME_PREDICATE_TAG, QueryRegistry, query_params
+from src.export.writers import export_path, open_writer
+
+# Benchmark Variables
+# Tables to replay and how many rows each TreatmentID fans out to
+tables = {
+    "Treatment": 1,
+    "TreatmentProduct": 8,
+    "TreatmentDistinctRanked": 1,
+}
+volumes = [50000, 200000]  # Number of TreatmentIDs per run
+# Export paths replayed per table, legacy holds the whole day in memory and the others stream to the sink.
+# multi_table runs every treatment file through stream_all_tables like run() does by default
+modes = ["legacy", "stream", "pipelined", "range"]
+multi_table = True
+batch_size = 100000  # Defaults for run(), handed to each scenario so a caller's values reach the child process
+execute_latency = 0.0  # Seconds added to every execute, stands in for the server round trip
+date_start = dt.datetime(year=2025, month=1, day=18)
+date_end = date_start + dt.timedelta(days=1)
+
+# Largest value of the narrow integer types, synthetic values wrap so they never overflow their column
+_INT_MAX = {pl.Int8: 127, pl.UInt8: 255, pl.Int16: 32767, pl.UInt16: 65535}
+
+
+class SyntheticCursor:
+    """
+    DB-API stand-in for a pymssql cursor, every execute replays synthetic rows for the id window in the table's
+    data_types column order. LoggedUTC style columns spread over the padded day so the date filter has work to do.
+    """
+
+    def __init__(self, table: str, rows_per_id: int, id_start: int, id_end: int, latency: float = 0.0):
+        self.table = table
+        self.rows_per_id = rows_per_id
+        self.latency = latency
+        self.data_types = apo_extract_script.data_types[table]
+        self.execute_seconds = 0.0
+        self.fetch_seconds = 0.0
+        self._rows = []
+        self._id_start = id_start
+        self._seconds_per_id = (26 * 3600) / max(id_end - id_start, 1)
+
+    def _value(self, dtype, tid: int, ix: int, logged: dt.datetime):
+        if dtype == pl.Datetime:
+            return logged
+        elif dtype in (pl.Utf8, pl.Categorical):
+            # Every so often a value carries the tabs and newlines the export strips
+            return f"v{(tid + ix) % 17}\t{tid % 3}" if tid % 50 == 0 else f"v{(tid + ix) % 17}"
+        elif dtype == pl.Boolean:
+            return tid % 2 == 0
+        elif dtype in (pl.Float32, pl.Float64):
+            return tid / 7
+        value = tid % 100000 + ix
+        return value % (_INT_MAX[dtype] + 1) if dtype in _INT_MAX else value
+
+    def execute(self, sql_query, params):
+        start_time = time.perf_counter()
+        id_start, id_end = params[0], params[1]
+        time_window = (params[2], params[3]) if TIME_PREDICATE_TAG in sql_query else None
+
+        rows = []
+        for tid in range(id_start, id_end + 1):
+            logged = date_start - dt.timedelta(hours=1) + \
+                dt.timedelta(seconds=(tid - self._id_start) * self._seconds_per_id)
+            if time_window is not None and not (time_window[0] <= logged <= time_window[1]):
+                continue
+            for ix in range(self.rows_per_id):
+                row = [self._value(dtype, tid, ix, logged) for dtype in self.data_types.values()]
+                row[0] = tid
+                rows.append(tuple(row))
+
+        self._rows = rows
+        if self.latency:
+            time.sleep(self.latency)
+        self.execute_seconds += time.perf_counter() - start_time
+
+    def fetchmany(self, size: int):
+        start_time = time.perf_counter()
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        self.fetch_seconds += time.perf_counter() - start_time
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows))
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class SyntheticBatchCursor:
+    """
+    Stand-in for a cursor running a batch of per table statements, each statement's rows come back as the next
+    result set through nextset like pymssql
+    """
+
+    def __init__(self, cursors: List[SyntheticCursor]):
+        # Same order as the statements in the batch
+        self.cursors = cursors
+        self._current = 0
+
+    @property
+    def execute_seconds(self) -> float:
+        return sum(cursor.execute_seconds for cursor in self.cursors)
+
+    @property
+    def fetch_seconds(self) -> float:
+        return sum(cursor.fetch_seconds for cursor in self.cursors)
+
+    def execute(self, sql_query, params):
+        offset = 0
+        for cursor, statement in zip(self.cursors, sql_query.split("\n;\n")):
+            count = len(query_params(statement, (0, 0), None, None))
+            cursor.execute(statement, params[offset:offset + count])
+            offset += count
+        self._current = 0
+
+    def fetchmany(self, size: int):
+        return self.cursors[self._current].fetchmany(size)
+
+    def fetchall(self):
+        return self.cursors[self._current].fetchall()
+
+    def nextset(self):
+        self._current += 1
+        return True if self._current < len(self.cursors) else None
+
+    def close(self):
+        pass
+
+
+# Wrap a function so its wall time accumulates under a stage name
+def _timed(stages: Dict[str, float], stage: str, func):
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stages[stage] += time.perf_counter() - start_time
+
+    return wrapper
+
+
+# Stage seconds of every window a run's ExportMetrics emitted, summed over windows and tables
+def _metric_stages(path: str, run_id: str) -> Dict[str, float]:
+    stages = {"query": 0.0, "fetch": 0.0, "convert": 0.0, "cast": 0.0, "write": 0.0, "bytes": 0.0}
+    with open(path) as file:
+        for line in file:
+            record = json.loads(line)
+            if record["run"] == run_id and record["event"] == "window":
+                for name in stages:
+                    stages[name] += record[f"{name}_seconds"] if name != "bytes" else record["bytes"]
+    return stages
+
+
+# Replay the legacy path, the whole day is held in memory and zipped at the end
+def _run_legacy(queries: QueryRegistry, table: str, rows_per_id: int, id_start: int, id_end: int, batch_size: int,
+                execute_latency: float) -> dict:
+    sql_query = queries.query(table)
+    filter_key = apo_extract_script.cross_join_inverse(apo_extract_script.filter_relationship)[table]
+    filter_column = apo_extract_script.column_relationship[filter_key]
+
+    cursor = SyntheticCursor(table, rows_per_id, id_start, id_end, execute_latency)
+    stages = {"fetch_frame": 0.0, "cast": 0.0, "write": 0.0}
+    apo_extract_script.fetch_frame = _timed(stages, "fetch_frame", apo_extract_script.fetch_frame)
+    apo_extract_script.process_batch = _timed(stages, "cast", apo_extract_script.process_batch)
+
+    start_time = time.perf_counter()
+    res_df = apo_extract_script.retrieve_and_process_data(cursor, sql_query, id_start, id_end, batch_size,
+                                                          apo_extract_script.data_types[table], filter_column,
+                                                          date_start, date_end)
+    write_start = time.perf_counter()
+    apo_extract_script.save_and_zip_data(res_df, table, date_start, date_end)
+    stages["write"] = time.perf_counter() - write_start
+
+    return {
+        "rows": len(res_df),
+        "seconds": time.perf_counter() - start_time,
+        "frame_mb": res_df.estimated_size() / 1024 ** 2,
+        "zip_mb": os.path.getsize(export_path(table, date_start, date_end)) / 1024 ** 2,
+        "query_seconds": cursor.execute_seconds,
+        "fetch_seconds": cursor.fetch_seconds,
+        # fetch_frame covers fetchmany plus the row to column conversion
+        "convert_seconds": stages["fetch_frame"] - cursor.fetch_seconds,
+        "cast_seconds": stages["cast"],
+        "write_seconds": stages["write"],
+    }
+
+
+# Replay one of the streaming paths, stage timings come from the export's own metrics
+def _run_streamed(queries: QueryRegistry, mode: str, table: Optional[str], rows_per_id: int, id_start: int,
+                  id_end: int, batch_size: int, execute_latency: float) -> dict:
+    metrics = ExportMetrics("./TreatmentExport/metrics.jsonl")
+    start_time = time.perf_counter()
+    if mode == "multi_table":
+        cursor = SyntheticBatchCursor([SyntheticCursor(i, tables.get(i, rows_per_id), id_start, id_end,
+                                                       execute_latency) for i in apo_extract_script.treatment_files])
+        rows = sum(apo_extract_script.stream_all_tables(cursor, date_start, date_end, id_start, id_end, batch_size,
+                                                        metrics=metrics, pipeline=True, queries=queries).values())
+        outputs = [export_path(i, date_start, date_end) for i in apo_extract_script.treatment_files]
+    else:
+        sql_query = queries.query(table)
+        filter_key = apo_extract_script.cross_join_inverse(apo_extract_script.filter_relationship)[table]
+        filter_column = apo_extract_script.column_relationship[filter_key]
+        cursor = SyntheticCursor(table, rows_per_id, id_start, id_end, execute_latency)
+        with open_writer(table, date_start, date_end) as writer:
+            args = (cursor, sql_query, id_start, id_end, batch_size, apo_extract_script.data_types[table],
+                    filter_column, date_start, date_end, writer)
+            if mode == "stream":
+                apo_extract_script.stream_and_process_data(*args, metrics=metrics.table(table, date_start))
+            elif mode == "pipelined":
+                pipelined_stream_and_process_data(*args, metrics=metrics.table(table, date_start))
+            else:
+                stream_range_and_process_data(cursor, sql_query, id_start, id_end,
+                                              apo_extract_script.data_types[table], filter_column, date_start,
+                                              date_end, writer, metrics=metrics.table(table, date_start))
+        rows = writer.rows_written
+        outputs = [writer.path]
+    seconds = time.perf_counter() - start_time
+
+    stages = _metric_stages(metrics.path, metrics.run_id)
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "frame_mb": stages["bytes"] / 1024 ** 2,
+        "zip_mb": sum(os.path.getsize(path) for path in outputs) / 1024 ** 2,
+        # Stages overlap on their own threads in the pipelined paths, so they can add up past seconds
+        **{f"{name}_seconds": stages[name] for name in ("query", "fetch", "convert", "cast", "write")},
+    }
+
+
+# Run a single mode, table and volume, meant to run in its own process so peak RSS belongs to this scenario alone
+def run_scenario(mode: str, table: Optional[str], rows_per_id: int, volume: int, workdir: str, batch_size: int,
+                 execute_latency: float) -> dict:
+    id_start, id_end = 1000000, 1000000 + volume
+    # Templates are read before leaving the repository root
+    queries = QueryRegistry(apo_extract_script.data_types)
+
+    # Output lands in a fresh scratch directory, never next to real exports or an earlier scenario's
+    os.chdir(tempfile.mkdtemp(dir=workdir))
+    res = _run_legacy(queries, table, rows_per_id, id_start, id_end, batch_size, execute_latency) \
+        if mode == "legacy" else \
+        _run_streamed(queries, mode, table, rows_per_id, id_start, id_end, batch_size, execute_latency)
+
+    rows, seconds, frame_mb, zip_mb = res.pop("rows"), res.pop("seconds"), res.pop("frame_mb"), res.pop("zip_mb")
+    return {
+        "mode": mode,
+        "table": table if table is not None else "all",
+        "ids": volume,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds,
+        "mb_per_second": frame_mb / seconds,
+        "frame_mb": frame_mb,
+        "zip_mb": zip_mb,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        **res,
+    }
+
+
+def run(scenarios: Optional[List[tuple]] = None, batch_size: int = batch_size,
+        execute_latency: float = execute_latency) -> pl.DataFrame:
+    """
+    :param scenarios: (mode, table, rows_per_id, volume) tuples, table is None for multi_table
+    """
+    scenarios = scenarios or [(mode, table, rows_per_id, volume) for mode in modes
+                              for table, rows_per_id in tables.items() for volume in volumes] + \
+        ([("multi_table", None, 1, volume) for volume in volumes] if multi_table else [])
+    results = []
+    # Fresh process per scenario, ru_maxrss is a high water mark for the whole process
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode, table, rows_per_id, volume in scenarios:
+            with context.Pool(1) as pool:
+                res = pool.apply(run_scenario, (mode, table, rows_per_id, volume, workdir, batch_size,
+                                                execute_latency))
+            print(res)
+            results.append(res)
+
+    res_df = pl.DataFrame(results)
+    with pl.Config(tbl_cols=-1, tbl_rows=-1, tbl_width_chars=250):
+        print(res_df)
+
+    return res_df
+
+
+if __name__ == "__main__":
+    run()
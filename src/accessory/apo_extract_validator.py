@@ -1,19 +1,15 @@
 # Internal
 import datetime
-import time
 from typing import Dict, List
 
 from src.models.connector import SqlServerConnection, ConnectionType
+from src.export.catalog import ExportCatalog
 import traceback
 import pymssql
 import polars as pl
 import datetime as dt
-import zipfile
-import os
 from collections import defaultdict
 
-from pathlib import Path
-
 treatment_files = [
     #"Treatment", #-- one with issues
     #"TreatmentProductRanked",
@@ -189,36 +185,11 @@ data_types = {
     }
 }
 
+catalog = ExportCatalog()
 for i in treatment_files:
-    directory_name = f"./TreatmentExport/{i}"
-    directory_path = Path(directory_name)
-
-    target_files = []
-    # Extract Base File and Parts if present
-    for file in directory_path.iterdir():
-        #print(file.is_file() and "-09-" in file.name, ".zip" in file.name, int(file.name.split("-")[-1].strip(".zip")) >= 18) # and int(file.name.split("-")[-1].strip(".zip")) <= 23:)
-        if file.is_file() and "-09-" in file.name and ".zip" in file.name and int(file.name.split("-")[-1].strip(".zip")) >= 24: # and int(file.name.split("-")[-1].strip(".zip")) <= 23:
-            target_files.append(file.name)
-
-    for target_file in target_files:
-        zip_file = target_file
-        csv_file = target_file.replace(".zip", ".csv")
-
-        target = f"{directory_name}/{zip_file}"
-        target_csv = target.replace(".zip", ".csv")
-
-        print(target_csv)
-
-        with zipfile.ZipFile(target, 'r') as zip_ref:
-            zip_ref.extractall(directory_name)
-
-        memory = pl.read_csv(target_csv, separator=";", schema=data_types[i])
-
-        # with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        #     zipf.write(target_csv, os.path.basename(target_csv))
-
-        if os.path.exists(target_csv):
-            os.remove(target_csv)
-
-        time.sleep(30.0)
+    # Read each exported day straight out of its archive, nothing is extracted to disk
+    for file in catalog.files(i):
+        if file.date_end.month == 9 and file.date_end.day >= 24:
+            print(file.path)
 
+            memory = catalog.scan_file(file, data_types[i]).collect()
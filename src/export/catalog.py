@@ -0,0 +1,166 @@
+# External
+import datetime as dt
+import re
+import zipfile
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import polars as pl
+from polars.io.plugins import register_io_source
+
+# Internal
+from src.export.fetch import load_schema
+from src.export.writers import OutputFormat
+
+_EXPORT_PATTERN = re.compile(r"^(?P<table>.+)_(?P<start>\d{4}-\d{2}-\d{2})_to_(?P<end>\d{4}-\d{2}-\d{2})"
+                             r"(?:_part(?P<part>\d+))?\.(?P<extension>zip|parquet|arrows)$")
+
+# Rows parsed per batch out of a zipped csv when polars doesn't ask for a batch size
+CSV_BATCH_ROWS = 100000
+
+# Columnar formats are preferred when a day was exported more than once
+_FORMAT_PREFERENCE = [OutputFormat.Parquet, OutputFormat.ArrowIpc, OutputFormat.Csv]
+
+
+@dataclass(frozen=True)
+class ExportFile:
+    table: str
+    date_start: dt.date
+    date_end: dt.date
+    part: Optional[int]
+    output_format: OutputFormat
+    path: str
+
+
+# Lazy scan over a zipped csv, the entry is streamed out of the archive batch by batch so nothing is extracted to disk
+# and filters and row limits apply per batch. Rows are split on line ends, the export strips newlines from values
+def _scan_zip_csv(path: str, data_types: Optional[Dict[str, pl.DataType]]) -> pl.LazyFrame:
+    # Columns come from the header, anything without a known type stays a string
+    with zipfile.ZipFile(path, 'r') as zip_ref, zip_ref.open(zip_ref.namelist()[0]) as entry:
+        header = entry.readline().decode().rstrip("\r\n").split(";")
+    types = load_schema(data_types) if data_types is not None else {}
+    schema = {col: types.get(col, pl.Utf8) for col in header}
+
+    def source(with_columns, predicate, n_rows, batch_size) -> Iterator[pl.DataFrame]:
+        remaining = n_rows
+        with zipfile.ZipFile(path, 'r') as zip_ref, zip_ref.open(zip_ref.namelist()[0]) as entry:
+            header_line = entry.readline()
+            while True:
+                lines = list(islice(entry, batch_size or CSV_BATCH_ROWS))
+                if not lines:
+                    return
+                # Projection pushdown, only the requested columns are parsed
+                res = pl.read_csv(header_line + b"".join(lines), separator=";", schema=schema, columns=with_columns)
+                if predicate is not None:
+                    res = res.filter(predicate)
+                if remaining is not None:
+                    res = res.head(remaining)
+                    remaining -= len(res)
+                yield res
+                if remaining is not None and remaining <= 0:
+                    return
+
+    return register_io_source(source, schema=schema)
+
+
+# Lazy scan over an Arrow IPC stream, read batch by batch
+def _scan_arrow_stream(path: str) -> pl.LazyFrame:
+    import pyarrow as pa
+
+    with pa.OSFile(path, "rb") as source_file:
+        schema = dict(pl.from_arrow(pa.ipc.open_stream(source_file).schema.empty_table()).schema)
+
+    def source(with_columns, predicate, n_rows, batch_size) -> Iterator[pl.DataFrame]:
+        remaining = n_rows
+        with pa.OSFile(path, "rb") as source_file:
+            for batch in pa.ipc.open_stream(source_file):
+                res = pl.from_arrow(batch)
+                if with_columns is not None:
+                    res = res.select(with_columns)
+                if predicate is not None:
+                    res = res.filter(predicate)
+                if remaining is not None:
+                    res = res.head(remaining)
+                    remaining -= len(res)
+                yield res
+                if remaining is not None and remaining <= 0:
+                    return
+
+    return register_io_source(source, schema=schema)
+
+
+class ExportCatalog:
+    """
+    Catalog of the exported days under ./TreatmentExport, scanned as a single polars LazyFrame. Days outside the
+    requested range are pruned on the file name, column selection and filters are pushed into each file's scan.
+    """
+    root: str
+
+    def __init__(self, root: str = "./TreatmentExport"):
+        self.root = root
+
+    def tables(self) -> List[str]:
+        return sorted(directory.name for directory in Path(self.root).iterdir() if directory.is_dir())
+
+    def files(self, table: str) -> List[ExportFile]:
+        """
+        Export files for a table, one entry per exported day. Combined files win over parts and columnar formats
+        over zipped csv; a day that was only ever resumed lists all of its parts.
+        """
+        directory = Path(self.root) / table
+        if not directory.is_dir():
+            return []
+
+        days = defaultdict(list)
+        for file in directory.iterdir():
+            match = _EXPORT_PATTERN.match(file.name)
+            if not file.is_file() or not match or match["table"] != table:
+                continue
+            days[(match["start"], match["end"])].append(ExportFile(
+                table, dt.date.fromisoformat(match["start"]), dt.date.fromisoformat(match["end"]),
+                int(match["part"]) if match["part"] is not None else None,
+                OutputFormat(match["extension"]), str(file)
+            ))
+
+        res = []
+        for key in sorted(days):
+            for output_format in _FORMAT_PREFERENCE:
+                candidates = [file for file in days[key] if file.output_format == output_format]
+                combined = [file for file in candidates if file.part is None]
+                if combined or candidates:
+                    res.extend(combined or sorted(candidates, key=lambda file: file.part))
+                    break
+
+        return res
+
+    def days(self, table: str) -> List[dt.date]:
+        return sorted({file.date_start for file in self.files(table)})
+
+    def scan_file(self, file: ExportFile, data_types: Optional[Dict[str, pl.DataType]] = None) -> pl.LazyFrame:
+        if file.output_format == OutputFormat.Parquet:
+            return pl.scan_parquet(file.path)
+        elif file.output_format == OutputFormat.ArrowIpc:
+            return _scan_arrow_stream(file.path)
+        return _scan_zip_csv(file.path, data_types)
+
+    def scan(self, table: str, date_start=None, date_end=None,
+             data_types: Optional[Dict[str, pl.DataType]] = None) -> pl.LazyFrame:
+        """
+        LazyFrame over every exported file of a table overlapping [date_start, date_end)
+        The end date in a file name is inclusive, <table>_D_to_D holds day D, so a file is kept when its
+        [date_start, date_end] days meet the half open request. Pruning is per file, filter on the time column for
+        exact bounds.
+        :param data_types: column types for zipped csv, read as strings when not given
+        """
+        date_start = date_start.date() if isinstance(date_start, dt.datetime) else date_start
+        date_end = date_end.date() if isinstance(date_end, dt.datetime) else date_end
+        files = [file for file in self.files(table)
+                 if (date_start is None or file.date_end >= date_start)
+                 and (date_end is None or file.date_start < date_end)]
+        if not files:
+            return pl.LazyFrame(schema=load_schema(data_types) if data_types is not None else None)
+
+        return pl.concat([self.scan_file(file, data_types) for file in files], how="diagonal_relaxed")
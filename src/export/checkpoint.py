@@ -0,0 +1,173 @@
+# External
+import datetime as dt
+import json
+import os
+import zipfile
+from typing import Dict, Optional, Tuple
+
+# Internal
+from src.export.combine import combine_parts
+from src.export.writers import BatchWriter, OutputFormat, export_path, open_writer
+
+
+# Check an output file was closed cleanly, a hard kill leaves it without its zip directory or parquet footer
+def _is_valid(path: str, output_format: OutputFormat) -> bool:
+    if not os.path.exists(path):
+        return False
+    try:
+        if output_format == OutputFormat.Csv:
+            with zipfile.ZipFile(path) as zipf:
+                return zipf.testzip() is None
+        elif output_format == OutputFormat.Parquet:
+            import pyarrow.parquet as pq
+            pq.ParquetFile(path)
+        else:
+            import pyarrow as pa
+            with pa.OSFile(path, "rb") as source:
+                pa.ipc.open_stream(source).read_all()
+        return True
+    except Exception:
+        return False
+
+
+class CheckpointManifest:
+    """
+    Append only record of every completed (table, date, id window) with its row count and output offset.
+    Windows are always written in id order, so the completed windows of a table and date form a prefix of the id
+    range and a rerun resumes from the last completed window into the next _partN file. The same mechanism drives
+    incremental refreshes, a watermark records the highest id (and its LoggedUTC) exported so far for a day.
+    """
+    path: str
+
+    def __init__(self, path: str = "./TreatmentExport/manifest.jsonl"):
+        self.path = path
+        self._windows: Dict[Tuple[str, str], list] = {}
+        self._complete = set()
+        self._parts: Dict[Tuple[str, str], int] = {}
+        self._base_paths: Dict[Tuple[str, str], str] = {}
+        self._watermarks: Dict[Tuple[str, str], dict] = {}
+
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    if line.strip():
+                        self._load(json.loads(line))
+
+    @staticmethod
+    def _key(i: str, date_start) -> Tuple[str, str]:
+        return i, date_start.strftime("%Y-%m-%d")
+
+    def _load(self, record: dict):
+        key = (record["table"], record["date"])
+        if record.get("complete"):
+            self._complete.add(key)
+        elif "watermark" in record:
+            self._watermarks[key] = record
+        else:
+            self._windows.setdefault(key, []).append(record)
+
+    def _append(self, record: dict):
+        self._load(record)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _save(self):
+        # Rewrite the manifest after dropping windows that belong to unreadable output
+        with open(self.path, "w") as file:
+            for records in self._windows.values():
+                for record in records:
+                    file.write(json.dumps(record) + "\n")
+            for record in self._watermarks.values():
+                file.write(json.dumps(record) + "\n")
+            for table, date in self._complete:
+                file.write(json.dumps({"table": table, "date": date, "complete": True}) + "\n")
+
+    # Exposed methods ------------------------------------------------------------------------------------------------ #
+    def is_complete(self, i: str, date_start) -> bool:
+        return self._key(i, date_start) in self._complete
+
+    def resume_from(self, i: str, date_start) -> Optional[int]:
+        """
+        Last id covered by a completed window, None when nothing has been extracted yet
+        """
+        records = self._windows.get(self._key(i, date_start))
+        return max(record["end"] for record in records) if records else None
+
+    def watermark(self, i: str, date_start) -> Optional[Tuple[int, Optional[str]]]:
+        """
+        Highest id exported for a table and date with its LoggedUTC, None before the first refresh
+        """
+        record = self._watermarks.get(self._key(i, date_start))
+        return (record["watermark"], record["watermark_logged_utc"]) if record is not None else None
+
+    def open_writer(self, i: str, date_start, date_end, output_format: OutputFormat = OutputFormat.Csv) \
+            -> BatchWriter:
+        """
+        Opens the sink for a table and date, resuming into the next part when earlier windows are already on disk
+        :return: Writer for the windows that are still outstanding
+        """
+        key = self._key(i, date_start)
+        records = self._windows.get(key, [])
+        self._base_paths[key] = export_path(i, date_start, date_end, "", output_format.value)
+
+        # Keep windows up to the first part that can't be read back, those after it are pulled again
+        valid_parts = []
+        for part in sorted({record["part"] for record in records}):
+            path = export_path(i, date_start, date_end, f"_part{part}", output_format.value)
+            if part == 0 and not os.path.exists(path):
+                path = export_path(i, date_start, date_end, "", output_format.value)
+            if not _is_valid(path, output_format):
+                break
+            valid_parts.append(part)
+        if len(valid_parts) < len({record["part"] for record in records}):
+            self._windows[key] = [record for record in records if record["part"] in valid_parts]
+            self._watermarks.pop(key, None)
+            records = self._windows[key]
+            self._save()
+
+        # Fresh extract goes to the usual file name
+        if not records:
+            self._parts[key] = 0
+            return open_writer(i, date_start, date_end, output_format=output_format)
+
+        # First attempt wrote the unsuffixed file, move it into the part sequence so combine_parts picks it up. Once
+        # _part0 exists the unsuffixed file is an earlier combine of the parts, stale with another part on the way
+        base_path = self._base_paths[key]
+        part0_path = export_path(i, date_start, date_end, "_part0", output_format.value)
+        if 0 in valid_parts and os.path.exists(base_path):
+            if os.path.exists(part0_path):
+                os.remove(base_path)
+            else:
+                os.replace(base_path, part0_path)
+
+        part = max(valid_parts) + 1
+        self._parts[key] = part
+        print(f'resuming {i} for {key[1]} after id {self.resume_from(i, date_start)} into part {part}')
+        return open_writer(i, date_start, date_end, f"_part{part}", output_format)
+
+    def record_window(self, i: str, date_start, window: Tuple[int, int], rows: int, offset: int):
+        """
+        Mark an id window as written, offset is the number of rows already in the output file before it
+        """
+        table, date = self._key(i, date_start)
+        self._append({"table": table, "date": date, "start": window[0], "end": window[1], "rows": rows,
+                      "offset": offset, "part": self._parts.get((table, date), 0),
+                      "written_utc": dt.datetime.utcnow().isoformat()})
+
+    def record_watermark(self, i: str, date_start, id_end: int, id_end_logged=None):
+        table, date = self._key(i, date_start)
+        self._append({"table": table, "date": date, "watermark": id_end,
+                      "watermark_logged_utc": id_end_logged.isoformat() if id_end_logged is not None else None})
+
+    def record_complete(self, i: str, date_start):
+        """
+        Mark a table and date as finished, a day written over several parts is combined into its base file
+        """
+        table, date = self._key(i, date_start)
+        if self._parts.get((table, date), 0) > 0:
+            directory, name = os.path.split(self._base_paths[(table, date)])
+            combine_parts(directory, os.path.splitext(name)[0])
+        self._append({"table": table, "date": date, "complete": True})
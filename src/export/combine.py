@@ -0,0 +1,106 @@
+# External
+import os
+import re
+import shutil
+import zipfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Internal
+from src.export.writers import OutputFormat
+
+# Copy buffer for streaming csv between zip entries, memory stays bounded by it instead of the combined table
+COPY_BUFFER_SIZE = 16 * 1024 ** 2
+
+_PART_PATTERN = re.compile(r"^(?P<base>.+)_part(?P<part>\d+)\.(?P<extension>zip|parquet|arrows)$")
+
+
+# Group part files by base name and extension, each group sorted by part number
+def part_groups(directory: str) -> Dict[tuple, List[Path]]:
+    groups = defaultdict(list)
+    for file in Path(directory).iterdir():
+        match = _PART_PATTERN.match(file.name)
+        if file.is_file() and match:
+            groups[(match["base"], match["extension"])].append((int(match["part"]), file))
+
+    # Numeric order, _part10 comes after _part9
+    return {key: [file for _, file in sorted(files)] for key, files in groups.items()}
+
+
+# Stream every part's csv entry into a single zip entry, headers after the first part are skipped
+def combine_csv_zip_parts(parts: List[Path], zip_path: str):
+    csv_name = _PART_PATTERN.match(parts[0].name)["base"] + ".csv"
+    header = None
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with zipf.open(csv_name, 'w', force_zip64=True) as out:
+            for part in parts:
+                with zipfile.ZipFile(part, 'r') as zip_ref, zip_ref.open(zip_ref.namelist()[0]) as src:
+                    part_header = src.readline()
+                    if header is None:
+                        header = part_header
+                        out.write(header)
+                    elif part_header != header:
+                        raise ValueError(f"{part} header does not match {parts[0]}")
+                    shutil.copyfileobj(src, out, COPY_BUFFER_SIZE)
+
+
+# Copy every part's row groups into a single Parquet file, no csv parsing and one row group in memory at a time
+def combine_parquet_parts(parts: List[Path], parquet_path: str):
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for part in parts:
+            part_file = pq.ParquetFile(part)
+            if writer is None:
+                writer = pq.ParquetWriter(parquet_path, part_file.schema_arrow, compression="zstd")
+            for ix in range(part_file.num_row_groups):
+                writer.write_table(part_file.read_row_group(ix))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# Copy every part's record batches into a single Arrow IPC stream
+def combine_arrow_parts(parts: List[Path], arrow_path: str):
+    import pyarrow as pa
+
+    with pa.OSFile(arrow_path, "wb") as sink:
+        writer = None
+        try:
+            for part in parts:
+                with pa.OSFile(str(part), "rb") as source:
+                    reader = pa.ipc.open_stream(source)
+                    if writer is None:
+                        writer = pa.ipc.new_stream(sink, reader.schema,
+                                                   options=pa.ipc.IpcWriteOptions(compression="zstd"))
+                    for batch in reader:
+                        writer.write_batch(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+_COMBINERS = {
+    OutputFormat.Csv.value: combine_csv_zip_parts,
+    OutputFormat.Parquet.value: combine_parquet_parts,
+    OutputFormat.ArrowIpc.value: combine_arrow_parts,
+}
+
+
+# Combine every part group in a table directory into its base file, or only base_name's, parts are left in place
+def combine_parts(directory: str, base_name: Optional[str] = None) -> List[str]:
+    combined = []
+    for (group_name, extension), parts in part_groups(directory).items():
+        if base_name is not None and group_name != base_name:
+            continue
+        target = os.path.join(directory, f"{group_name}.{extension}")
+        print(f"combining {len(parts)} parts into {target}")
+
+        # Written next to the target and swapped in, an interrupted merge never leaves a half written base file
+        _COMBINERS[extension](parts, f"{target}.tmp")
+        os.replace(f"{target}.tmp", target)
+        combined.append(target)
+
+    return combined
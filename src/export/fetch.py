@@ -0,0 +1,60 @@
+# External
+from typing import Dict, Iterator, Optional
+
+import polars as pl
+
+# Internal
+from src.export.metrics import WindowMetrics, stage
+
+# Rows pulled per fetchmany call
+FETCH_CHUNK_SIZE = 50000
+
+
+# Column types used while loading, categoricals are encoded once per batch by the cast in process_batch
+def load_schema(data_types: Dict[str, pl.DataType]) -> Dict[str, pl.DataType]:
+    return {col: pl.Utf8 if dtype == pl.Categorical else dtype for col, dtype in data_types.items()}
+
+
+# Build a single typed column, falls back to row wise loading when the driver hands back a looser python type
+def _column(name: str, values, dtype: pl.DataType) -> pl.Series:
+    try:
+        return pl.Series(name, values, dtype=dtype)
+    except TypeError:
+        return pl.DataFrame([(v,) for v in values], schema={name: dtype}, orient="row").to_series()
+
+
+# Transpose fetched rows into typed columns
+def rows_to_frame(rows, data_types: Dict[str, pl.DataType]) -> pl.DataFrame:
+    schema = load_schema(data_types)
+    if isinstance(rows[0], dict):
+        # as_dict cursors, missing keys load as nulls like pl.DataFrame(rows, schema=...) does
+        columns = [[row.get(col) for row in rows] for col in schema]
+    else:
+        columns = zip(*rows)
+
+    return pl.DataFrame([_column(name, values, dtype) for (name, dtype), values in zip(schema.items(), columns)])
+
+
+# Read the current result set as fixed size frames, rows are pulled off the connection as each chunk is consumed so
+# memory stays bounded by a chunk however large the result set is
+def iter_frames(cursor, data_types: Dict[str, pl.DataType], chunk_size: int = FETCH_CHUNK_SIZE,
+                window_metrics: Optional[WindowMetrics] = None) -> Iterator[pl.DataFrame]:
+    while True:
+        with stage(window_metrics, "fetch"):
+            rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        with stage(window_metrics, "convert"):
+            frame = rows_to_frame(rows, data_types)
+        yield frame
+
+
+# Fetch the current result set in fetchmany chunks, None when it is empty
+def fetch_frame(cursor, data_types: Dict[str, pl.DataType], chunk_size: int = FETCH_CHUNK_SIZE,
+                window_metrics: Optional[WindowMetrics] = None) -> Optional[pl.DataFrame]:
+    frames = list(iter_frames(cursor, data_types, chunk_size, window_metrics))
+
+    if not frames:
+        return None
+
+    return frames[0] if len(frames) == 1 else pl.concat(frames)
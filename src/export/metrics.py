@@ -0,0 +1,120 @@
+# External
+import datetime as dt
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+
+# Print the wall time of a call, minutes like the rest of the export logs
+def time_it(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start_time = dt.datetime.now()
+        res = func(*args, **kwargs)
+        print(f'finish {func.__qualname__} duration (minutes): {(dt.datetime.now() - start_time).total_seconds() / 60}')
+        return res
+
+    return wrapper
+
+
+class ExportMetrics:
+    """
+    Per table and id window stage timings and throughput, appended as JSON lines so a night's run can be broken
+    down by table and stage and compared against earlier runs
+    """
+    path: str
+    run_id: str
+
+    def __init__(self, path: str = "./TreatmentExport/metrics.jsonl"):
+        self.path = path
+        self.run_id = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        self._lock = threading.Lock()
+
+    def _write(self, record: dict):
+        record = {"run": self.run_id, "written_utc": dt.datetime.utcnow().isoformat(), **record}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+
+    def table(self, i: str, date_start) -> "TableMetrics":
+        return TableMetrics(self, i, date_start.strftime("%Y-%m-%d"))
+
+
+class TableMetrics:
+    """
+    Metrics bound to a single table and date, a window's metrics stay open from its fetch until it is emitted
+    """
+
+    def __init__(self, sink: ExportMetrics, table: str, date: str):
+        self._sink = sink
+        self._windows: Dict[Tuple[int, int], WindowMetrics] = {}
+        self.table = table
+        self.date = date
+
+    def window(self, window: Tuple[int, int]) -> "WindowMetrics":
+        # Same object for the fetching worker and the writer
+        with self._sink._lock:
+            if window not in self._windows:
+                self._windows[window] = WindowMetrics(self, window)
+            return self._windows[window]
+
+    def file(self, writer):
+        """
+        Size of a closed output against the in memory size of what went into it
+        """
+        file_bytes = os.path.getsize(writer.path) if os.path.exists(writer.path) else 0
+        self._sink._write({"event": "file", "table": self.table, "date": self.date, "path": writer.path,
+                           "rows": writer.rows_written, "bytes": writer.bytes_written, "file_bytes": file_bytes,
+                           "compression_ratio": writer.bytes_written / file_bytes if file_bytes else None})
+
+
+class WindowMetrics:
+    """
+    Stage timings for a single id window, stages can be timed from a worker thread and emitted from the writer
+    """
+    stages = ("query", "fetch", "convert", "cast", "write")
+
+    def __init__(self, table_metrics: TableMetrics, window: Tuple[int, int]):
+        self._table_metrics = table_metrics
+        self.window = window
+        self.seconds = {name: 0.0 for name in self.stages}
+        self.rows = 0
+        self.bytes = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start_time
+
+    def add(self, rows: int = 0, nbytes: int = 0):
+        self.rows += rows
+        self.bytes += nbytes
+
+    def emit(self, skipped: bool = False):
+        """
+        :param skipped: the window was fetched but not written, a resumed run already had it on disk
+        """
+        with self._table_metrics._sink._lock:
+            self._table_metrics._windows.pop(self.window, None)
+        total = sum(self.seconds.values())
+        self._table_metrics._sink._write({
+            "event": "window", "table": self._table_metrics.table, "date": self._table_metrics.date,
+            "start": self.window[0], "end": self.window[1],
+            **{f"{name}_seconds": seconds for name, seconds in self.seconds.items()},
+            "rows": self.rows, "bytes": self.bytes, "skipped": skipped,
+            "rows_per_second": self.rows / total if total else None,
+            "mb_per_second": self.bytes / 1024 ** 2 / total if total else None,
+        })
+
+
+# Time a stage when metrics are on, no-op otherwise
+def stage(window_metrics: Optional[WindowMetrics], name: str):
+    return window_metrics.stage(name) if window_metrics is not None else nullcontext()
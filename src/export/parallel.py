@@ -0,0 +1,134 @@
+# External
+import datetime as dt
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Optional
+
+# Internal
+from src.models.connector import SqlServerConnection
+from src.export.fetch import fetch_frame
+from src.export.metrics import TableMetrics, stage
+from src.export.query import query_params
+from src.export.transform import process_batch, empty_frame
+from src.export.windows import AdaptiveBatchSize, id_windows
+from src.export.writers import BatchWriter
+
+
+class ConnectionPool:
+    """
+    Fixed size pool of SQL Server connections shared across worker threads, the size doubles as the concurrency cap
+    """
+    size: int
+
+    def __init__(self, conn_config: SqlServerConnection, size: int = 4, as_dict: bool = False):
+        self.size = size
+        self._as_dict = as_dict
+        self._connections = queue.Queue()
+        for _ in range(size):
+            self._connections.put(conn_config.connect())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @contextmanager
+    def cursor(self):
+        # Block until a connection is free, hand it back once the caller is done
+        connection = self._connections.get()
+        cursor = connection.cursor(as_dict=self._as_dict)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            self._connections.put(connection)
+
+    def close(self):
+        # Clean up connections to prevent rate limit
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+# Time a fetch against a cursor
+def _timed(fetch, cursor, window):
+    start_time = dt.datetime.now()
+    res = fetch(cursor, window)
+    return res, (dt.datetime.now() - start_time).total_seconds() / 60
+
+
+# Run fetch(cursor, window) on pooled connections, yields (iter, window, result, duration) in id order
+def ordered_map(pool: ConnectionPool, fetch, windows):
+    pending = deque()
+
+    def pooled(window):
+        with pool.cursor() as cursor:
+            return _timed(fetch, cursor, window)
+
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        for iter, window in enumerate(windows):
+            pending.append((iter, window, executor.submit(pooled, window)))
+            # Cap windows in flight so finished but unwritten batches can't pile up behind a slow one
+            if len(pending) >= pool.size * 2:
+                iter, window, future = pending.popleft()
+                yield (iter, window, *future.result())
+
+        while pending:
+            iter, window, future = pending.popleft()
+            yield (iter, window, *future.result())
+
+
+# Run fetch(cursor, window) on a single cursor, same shape as ordered_map
+def serial_map(cursor, fetch, windows):
+    for iter, window in enumerate(windows):
+        yield (iter, window, *_timed(fetch, cursor, window))
+
+
+# Fetch and process a single id window
+def _fetch_window(cursor, window, sql_query, data_types, filter_column, date_start, date_end,
+                  metrics: Optional[TableMetrics] = None):
+    window_metrics = metrics.window(window) if metrics is not None else None
+    with stage(window_metrics, "query"):
+        cursor.execute(sql_query, query_params(sql_query, window, date_start, date_end))
+    res = fetch_frame(cursor, data_types, window_metrics=window_metrics)
+    if res is None:
+        return None
+
+    with stage(window_metrics, "cast"):
+        return process_batch(res, data_types, filter_column, date_start, date_end)
+
+
+# Retrieve, Process and Stream Data across a pool of connections
+def parallel_stream_and_process_data(pool: ConnectionPool, sql_query, id_start, id_end, batch_size, data_types,
+                                     filter_column, date_start, date_end, writer: BatchWriter,
+                                     controller: Optional[AdaptiveBatchSize] = None,
+                                     metrics: Optional[TableMetrics] = None):
+    fetch = partial(_fetch_window, sql_query=sql_query, data_types=data_types, filter_column=filter_column,
+                    date_start=date_start, date_end=date_end, metrics=metrics)
+
+    # Windows are drawn lazily, the controller sizes them from the ones already back
+    windows = controller.windows(id_start, id_end) if controller is not None \
+        else id_windows(id_start, id_end, batch_size)
+    for iter, window, res, duration in ordered_map(pool, fetch, windows):
+        print(f'finish iteration {iter} start id: {window[0]}; end id: {window[1]}; '
+              f'duration (minutes): {duration}')
+        window_metrics = metrics.window(window) if metrics is not None else None
+        if res is not None:
+            with stage(window_metrics, "write"):
+                writer.write(res)
+        if window_metrics is not None:
+            window_metrics.add(len(res) if res is not None else 0, res.estimated_size() if res is not None else 0)
+            window_metrics.emit()
+        if controller is not None:
+            controller.observe(window, len(res) if res is not None else 0,
+                               res.estimated_size() if res is not None else 0, duration * 60)
+            print(f'next batch size: {controller.batch_size}; rows per second: {controller.rows_per_second}')
+
+    # Handle empty result so the sink still carries the header
+    if writer.batches_written == 0:
+        writer.write(process_batch(empty_frame(data_types), data_types, filter_column, date_start, date_end))
+
+    return writer.rows_written
@@ -0,0 +1,179 @@
+# External
+import datetime as dt
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, Optional
+
+# Internal
+from src.export.fetch import FETCH_CHUNK_SIZE, fetch_frame, iter_frames
+from src.export.metrics import TableMetrics, stage
+from src.export.query import query_params
+from src.export.transform import process_batch, empty_frame
+from src.export.windows import AdaptiveBatchSize, id_windows
+from src.export.writers import BatchWriter
+
+# Batches held between two stages, bounds memory to a few windows when a downstream stage falls behind
+PIPELINE_QUEUE_SIZE = 2
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+# Put with backpressure, gives up once the consumer has stopped so the stage thread can exit
+def _put(target: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+# Run a stage on its own thread, reads from an iterable and hands each (optionally transformed) item downstream
+def _stage(items: Iterable, transform: Optional[Callable], target: queue.Queue, stop: threading.Event):
+    try:
+        for item in items:
+            if not _put(target, transform(item) if transform is not None else item, stop):
+                return
+    except BaseException as err:
+        _put(target, _Failed(err), stop)
+        return
+    _put(target, _DONE, stop)
+
+
+# Drain a stage's queue, re-raises a failure from the stage on the consuming thread
+def _drain(source: queue.Queue, stop: Optional[threading.Event] = None) -> Iterator:
+    while True:
+        try:
+            item = source.get(timeout=0.5)
+        except queue.Empty:
+            # Upstream gave up because the consumer stopped
+            if stop is not None and stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failed):
+            raise item.error
+        yield item
+
+
+def pipelined(items: Iterable, transform: Optional[Callable] = None, queue_size: int = PIPELINE_QUEUE_SIZE) \
+        -> Iterator:
+    """
+    Producer / consumer pipeline over bounded queues. items is consumed on one thread, transform runs on a second
+    and the caller consumes the results, so network, CPU and disk work overlap.
+    """
+    stop = threading.Event()
+    fetched, transformed = queue.Queue(queue_size), queue.Queue(queue_size)
+    threads = [threading.Thread(target=_stage, args=(items, None, fetched, stop), daemon=True)]
+    if transform is not None:
+        threads.append(threading.Thread(target=_stage, args=(_drain(fetched, stop), transform, transformed, stop),
+                                        daemon=True))
+    for thread in threads:
+        thread.start()
+
+    try:
+        yield from _drain(transformed if transform is not None else fetched)
+    finally:
+        # Consumer stopped early or failed, release the stages blocked on a full queue
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+# Retrieve, Process and Stream Data with the fetch, transform and write stages overlapping on one connection
+def pipelined_stream_and_process_data(cursor, sql_query, id_start, id_end, batch_size, data_types, filter_column,
+                                      date_start, date_end, writer: BatchWriter,
+                                      controller: Optional[AdaptiveBatchSize] = None,
+                                      metrics: Optional[TableMetrics] = None,
+                                      queue_size: int = PIPELINE_QUEUE_SIZE):
+    windows = controller.windows(id_start, id_end) if controller is not None \
+        else id_windows(id_start, id_end, batch_size)
+
+    # Fetch stage, issues the next window while the previous one is still being processed
+    def fetch():
+        for iter, window in enumerate(windows):
+            window_metrics = metrics.window(window) if metrics is not None else None
+            start_time = dt.datetime.now()
+            with stage(window_metrics, "query"):
+                cursor.execute(sql_query, query_params(sql_query, window, date_start, date_end))
+            res = fetch_frame(cursor, data_types, window_metrics=window_metrics)
+            yield iter, window, res, (dt.datetime.now() - start_time).total_seconds()
+
+    # Transform stage, cast, date filter and character stripping
+    def transform(item):
+        iter, window, res, duration = item
+        if res is not None:
+            with stage(metrics.window(window) if metrics is not None else None, "cast"):
+                res = process_batch(res, data_types, filter_column, date_start, date_end)
+        return iter, window, res, duration
+
+    # Write stage, on the calling thread
+    for iter, window, res, duration in pipelined(fetch(), transform, queue_size):
+        print(f'finish iteration {iter} start id: {window[0]}; end id: {window[1]}; '
+              f'duration (minutes): {duration / 60}')
+        window_metrics = metrics.window(window) if metrics is not None else None
+        if res is not None:
+            with stage(window_metrics, "write"):
+                writer.write(res)
+        if window_metrics is not None:
+            window_metrics.add(len(res) if res is not None else 0, res.estimated_size() if res is not None else 0)
+            window_metrics.emit()
+        if controller is not None:
+            controller.observe(window, len(res) if res is not None else 0,
+                               res.estimated_size() if res is not None else 0, duration)
+            print(f'next batch size: {controller.batch_size}; rows per second: {controller.rows_per_second}')
+
+    # Handle empty result so the sink still carries the header
+    if writer.batches_written == 0:
+        writer.write(process_batch(empty_frame(data_types), data_types, filter_column, date_start, date_end))
+
+    return writer.rows_written
+
+
+# Retrieve, Process and Stream a whole id range from a single query, read back in fixed size fetchmany chunks
+def stream_range_and_process_data(cursor, sql_query, id_start, id_end, data_types, filter_column, date_start,
+                                  date_end, writer: BatchWriter, metrics: Optional[TableMetrics] = None,
+                                  chunk_size: int = FETCH_CHUNK_SIZE, queue_size: int = PIPELINE_QUEUE_SIZE):
+    """
+    One round trip for the whole range instead of one per id window, memory stays bounded by chunk_size rows per
+    stage. The query can't be resumed part way, so a failure restarts the range.
+    """
+    window = (id_start, id_end)
+    window_metrics = metrics.window(window) if metrics is not None else None
+    start_time = dt.datetime.now()
+
+    # Fetch stage, the query runs once and rows are pulled off the connection chunk by chunk
+    def fetch():
+        with stage(window_metrics, "query"):
+            cursor.execute(sql_query, query_params(sql_query, window, date_start, date_end))
+        yield from iter_frames(cursor, data_types, chunk_size, window_metrics)
+
+    # Transform stage, cast, date filter and character stripping
+    def transform(res):
+        with stage(window_metrics, "cast"):
+            return process_batch(res, data_types, filter_column, date_start, date_end)
+
+    # Write stage, on the calling thread
+    for iter, res in enumerate(pipelined(fetch(), transform, queue_size)):
+        with stage(window_metrics, "write"):
+            writer.write(res)
+        if window_metrics is not None:
+            window_metrics.add(len(res), res.estimated_size())
+        print(f'finish chunk {iter} rows: {writer.rows_written}; '
+              f'duration (minutes): {(dt.datetime.now() - start_time).total_seconds() / 60}')
+
+    if window_metrics is not None:
+        window_metrics.emit()
+
+    # Handle empty result so the sink still carries the header
+    if writer.batches_written == 0:
+        writer.write(process_batch(empty_frame(data_types), data_types, filter_column, date_start, date_end))
+
+    return writer.rows_written
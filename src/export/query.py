@@ -0,0 +1,94 @@
+# External
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import polars as pl
+
+# Tags the predicate so the fetch side knows to bind the time window after the id window
+TIME_PREDICATE_TAG = "-- time predicate"
+
+
+# Push the final date range filter into the sql so the server prunes the padded id range
+def with_time_predicate(sql_query: str, time_column: str) -> str:
+    """
+    Appends a time predicate to the trailing WHERE clause of a RawSQLQueries template. The id bounds stay first so
+    they still drive the index seek.
+    :param sql_query: template ending on its id range WHERE clause
+    :param time_column: qualified column the final date range filter runs on, e.g. t.[LoggedUTC]
+    """
+    return f"{sql_query.strip().rstrip(';')}\n  AND {time_column} >= %s AND {time_column} <= %s {TIME_PREDICATE_TAG}\n"
+
+
+# Parameters for a single execution, id window followed by the time window when the predicate is present
+def query_params(sql_query: str, window: Tuple[int, int], date_start, date_end) -> tuple:
+    return tuple(window) + ((date_start, date_end) if TIME_PREDICATE_TAG in sql_query else ())
+
+
+# Output name of every item in a template's SELECT list, alias or bracketed column with its table prefix dropped
+def select_columns(sql_query: str) -> List[str]:
+    sql_query = re.sub(r"--[^\n]*", "", sql_query)
+    select_list = re.search(r"\bSELECT\b(.*?)\bFROM\b", sql_query, re.IGNORECASE | re.DOTALL).group(1)
+    return [re.findall(r"\[?(\w+)\]?\s*$", item.strip())[0] for item in select_list.split(",")]
+
+
+# Wrap a template in sp_executesql, the statement text stays the same for every window and day so its plan is reused
+def prepared_statement(sql_query: str, param_types: List[str]) -> str:
+    """
+    Parameters are still bound by the driver as %s, in the same order, so query_params works unchanged
+    :param param_types: sql type of each %s in order, e.g. ["bigint", "bigint"]
+    """
+    parts = sql_query.split("%s")
+    if len(parts) - 1 != len(param_types):
+        raise ValueError(f"{len(parts) - 1} placeholders for {len(param_types)} parameter types")
+    statement = "".join(part + (f"@p{ix}" if ix < len(param_types) else "") for ix, part in enumerate(parts))
+    # Quotes inside the template are doubled up to survive the N'' literal
+    statement = statement.replace("'", "''")
+    declarations = ", ".join(f"@p{ix} {param_type}" for ix, param_type in enumerate(param_types))
+    return f"EXEC sp_executesql N'{statement.strip()}\n', N'{declarations}', {', '.join(['%s'] * len(param_types))}"
+
+
+class QueryRegistry:
+    """
+    RawSQLQueries templates loaded once and checked against the data_types column order, fetched rows are mapped
+    to columns by position so a template out of step with its data_types silently shifts values between columns.
+    Built variants (time predicate, sp_executesql) are cached, every window and day executes the same text.
+    """
+    id_type = "bigint"
+    time_type = "datetime"
+
+    def __init__(self, data_types: Dict[str, Dict[str, pl.DataType]], directory: str = "./src/RawSQLQueries",
+                 prepared: bool = False):
+        self.prepared = prepared
+        self._templates: Dict[str, str] = {}
+        self._queries: Dict[Tuple[str, Optional[str]], str] = {}
+
+        mismatches = []
+        for i, columns in data_types.items():
+            with open(os.path.join(directory, f"{i}.sql")) as file:
+                self._templates[i] = file.read()
+            sql_columns = select_columns(self._templates[i])
+            if sql_columns != list(columns):
+                mismatches.append(f"{i}: " + ", ".join(
+                    f"{sql} != {expected}" for sql, expected in zip(sql_columns, columns) if sql != expected)
+                    if len(sql_columns) == len(columns) else f"{i}: {len(sql_columns)} columns, expected {len(columns)}")
+        if mismatches:
+            raise ValueError("RawSQLQueries out of step with data_types, " + "; ".join(mismatches))
+
+    def query(self, i: str, time_column: Optional[str] = None) -> str:
+        """
+        Sql for a table, built on first use
+        :param time_column: qualified column to push the date range filter onto, None for the id range alone
+        """
+        key = (i, time_column)
+        if key not in self._queries:
+            sql_query = self._templates[i]
+            if time_column is not None:
+                sql_query = with_time_predicate(sql_query, time_column)
+            if self.prepared:
+                param_types = [self.id_type] * self._templates[i].count("%s") + \
+                              [self.time_type] * (2 if time_column is not None else 0)
+                sql_query = prepared_statement(sql_query, param_types)
+            self._queries[key] = sql_query
+
+        return self._queries[key]
@@ -0,0 +1,133 @@
+# External
+from functools import partial
+from itertools import chain
+from typing import Dict, List, Optional
+
+# Internal
+from src.export.checkpoint import CheckpointManifest
+from src.export.fetch import fetch_frame
+from src.export.metrics import ExportMetrics, TableMetrics, stage
+from src.export.parallel import ConnectionPool, ordered_map, serial_map
+from src.export.pipeline import pipelined
+from src.export.query import query_params
+from src.export.transform import process_batch, empty_frame
+from src.export.windows import AdaptiveBatchSize, id_windows
+from src.export.writers import BatchWriter
+
+
+# Join the per table queries into one batch, each statement returns its own result set
+def batch_query(sql_queries: Dict[str, str]) -> str:
+    return "\n;\n".join(query.strip().rstrip(";") for query in sql_queries.values())
+
+
+# Parameters for the batch, each statement binds its own id window and optional time window
+def batch_params(sql_queries: Dict[str, str], window, date_start, date_end) -> tuple:
+    return sum((query_params(query, window, date_start, date_end) for query in sql_queries.values()), ())
+
+
+# Fetch every table for a single id window in one round trip, raw frames unless process is set
+def _fetch_tables(cursor, window, sql_queries: Dict[str, str], tables: List[str], data_types, filter_columns,
+                  date_start, date_end, table_metrics: Optional[Dict[str, TableMetrics]] = None, process: bool = True):
+    res = {}
+    for ix, i in enumerate(tables):
+        window_metrics = table_metrics[i].window(window) if table_metrics is not None else None
+        # The batch's execute counts toward the first table, moving to each next result set toward its own
+        with stage(window_metrics, "query"):
+            if ix == 0:
+                cursor.execute(batch_query(sql_queries), batch_params(sql_queries, window, date_start, date_end))
+            else:
+                cursor.nextset()
+        res[i] = fetch_frame(cursor, data_types[i], window_metrics=window_metrics)
+
+    return _process_tables(res, window, data_types, filter_columns, date_start, date_end, table_metrics) \
+        if process else res
+
+
+# Cast, date filter and character stripping of every table fetched for a window
+def _process_tables(res: Dict, window, data_types, filter_columns, date_start, date_end,
+                    table_metrics: Optional[Dict[str, TableMetrics]] = None):
+    processed = {}
+    for i, frame in res.items():
+        with stage(table_metrics[i].window(window) if table_metrics is not None else None, "cast"):
+            processed[i] = process_batch(frame, data_types[i], filter_columns[i], date_start, date_end) \
+                if frame is not None else None
+
+    return processed
+
+
+# Retrieve, Process and Stream every table per id window, so each window's index seek happens once per day
+def multi_table_stream_and_process_data(source, sql_queries: Dict[str, str], id_start, id_end, batch_size,
+                                        data_types: Dict[str, Dict], filter_columns: Dict[str, str], date_start,
+                                        date_end, writers: Dict[str, BatchWriter],
+                                        manifest: Optional[CheckpointManifest] = None,
+                                        controller: Optional[AdaptiveBatchSize] = None,
+                                        metrics: Optional[ExportMetrics] = None, pipeline: bool = False):
+    tables = list(sql_queries.keys())
+    table_metrics = {i: metrics.table(i, date_start) for i in tables} if metrics is not None else None
+
+    # Resume after the windows every table already has on disk
+    done = {i: manifest.resume_from(i, date_start) if manifest is not None else None for i in tables}
+    catch_up = []
+    if all(done[i] is not None for i in tables):
+        id_start = max(id_start, min(min(done.values()) + 1, id_end))
+        # Tables stopped on different windows, the first window ends on the furthest one so none straddles it
+        if min(done.values()) < max(done.values()):
+            catch_up = [(id_start, min(max(done.values()), id_end))]
+            id_start = min(catch_up[0][1] + 1, id_end)
+
+    fetch = partial(_fetch_tables, sql_queries=sql_queries, tables=tables, data_types=data_types,
+                    filter_columns=filter_columns, date_start=date_start, date_end=date_end,
+                    table_metrics=table_metrics)
+
+    # Transform stage of the pipeline, the fetch thread hands raw frames over and goes on to the next window
+    def transform(item):
+        iter, window, res, duration = item
+        return iter, window, _process_tables(res, window, data_types, filter_columns, date_start, date_end,
+                                             table_metrics), duration
+
+    # Source is either a single cursor or a pool of connections
+    windows = chain(catch_up, controller.windows(id_start, id_end) if controller is not None
+                    else id_windows(id_start, id_end, batch_size))
+    if isinstance(source, ConnectionPool):
+        results = ordered_map(source, fetch, windows)
+    elif pipeline:
+        # Next window is fetched, this one processed and the previous one written on their own threads
+        results = pipelined(serial_map(source, partial(fetch, process=False), windows), transform)
+    else:
+        results = serial_map(source, fetch, windows)
+
+    for iter, window, res, duration in results:
+        print(f'finish iteration {iter} start id: {window[0]}; end id: {window[1]}; '
+              f'duration (minutes): {duration}')
+        for i, frame in res.items():
+            window_metrics = table_metrics[i].window(window) if table_metrics is not None else None
+            # Table finished this window before the last run stopped
+            if done[i] is not None and window[1] <= done[i]:
+                if window_metrics is not None:
+                    window_metrics.emit(skipped=True)
+                continue
+            offset = writers[i].rows_written
+            if frame is not None:
+                with stage(window_metrics, "write"):
+                    writers[i].write(frame)
+            if manifest is not None:
+                manifest.record_window(i, date_start, window, writers[i].rows_written - offset, offset)
+            if window_metrics is not None:
+                window_metrics.add(len(frame) if frame is not None else 0,
+                                   frame.estimated_size() if frame is not None else 0)
+                window_metrics.emit()
+
+        # Size the next window from this one
+        if controller is not None:
+            frames = [frame for frame in res.values() if frame is not None]
+            controller.observe(window, sum(len(frame) for frame in frames),
+                               sum(frame.estimated_size() for frame in frames), duration * 60)
+            print(f'next batch size: {controller.batch_size}; rows per second: {controller.rows_per_second}')
+
+    # Handle empty result so every sink still carries the header
+    for i in tables:
+        if writers[i].batches_written == 0:
+            writers[i].write(process_batch(empty_frame(data_types[i]), data_types[i], filter_columns[i], date_start,
+                                           date_end))
+
+    return {i: writers[i].rows_written for i in tables}
@@ -0,0 +1,64 @@
+# External
+import datetime as dt
+import os
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+
+import polars as pl
+
+Anchor = Tuple[int, dt.datetime]
+
+
+class TimeIndex:
+    """
+    Persistent sparse index of sampled (id, logged time) pairs for a table, shared by id_finder and daily_export.
+    Treats the id as roughly monotonic in the logged time so id lookups start from the tightest known bracket
+    instead of the whole table, and grows as new days are looked up.
+    """
+    path: str
+
+    def __init__(self, table: str, id_col: str, time_col: str, directory: str = "./data/time_index"):
+        self.path = f"{directory}/{table}.{id_col}.{time_col}.csv"
+        self._ids, self._times = [], []
+
+        if os.path.exists(self.path):
+            anchors = pl.read_csv(self.path, schema={"id": pl.Int64, "logged": pl.Datetime}).sort("id")
+            self._ids, self._times = anchors.get_column("id").to_list(), anchors.get_column("logged").to_list()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, anchor_id: int, logged: dt.datetime):
+        ix = bisect_left(self._ids, anchor_id)
+        if ix < len(self._ids) and self._ids[ix] == anchor_id:
+            return
+        self._ids.insert(ix, anchor_id)
+        self._times.insert(ix, logged)
+
+    def bracket(self, target_time: dt.datetime) -> Tuple[Optional[Anchor], Optional[Anchor]]:
+        """
+        Closest known anchors either side of the target time
+        :return: (lower, upper), either is None when the target falls outside the known anchors
+        """
+        ix = bisect_right(self._times, target_time)
+        lower = (self._ids[ix - 1], self._times[ix - 1]) if ix > 0 else None
+        upper = (self._ids[ix], self._times[ix]) if ix < len(self._ids) else None
+
+        # Out of order anchors, don't trust the bracket
+        if (lower is not None and lower[1] > target_time) or (upper is not None and upper[1] < target_time):
+            return None, None
+
+        return lower, upper
+
+    @staticmethod
+    def sample_ids(start_id: int, end_id: int, samples: int) -> List[int]:
+        """
+        Evenly spaced ids strictly inside (start_id, end_id)
+        """
+        step = (end_id - start_id) / (samples + 1)
+        return sorted({int(start_id + step * (ix + 1)) for ix in range(samples)} - {start_id, end_id})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        pl.DataFrame({"id": self._ids, "logged": self._times},
+                     schema={"id": pl.Int64, "logged": pl.Datetime}).write_csv(self.path)
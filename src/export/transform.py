@@ -0,0 +1,60 @@
+# External
+from typing import Dict
+
+import polars as pl
+
+# Characters that would break the csv rows, replaced with a space
+CONTROL_CHARACTERS = r"[\n\t]"
+
+
+# Build an empty frame carrying the table columns, used to guard against empty periods
+def empty_frame(data_types: Dict[str, pl.DataType]) -> pl.DataFrame:
+    return pl.DataFrame({i: [] for i in data_types.keys()})
+
+
+# Replace a Categorical's dirty categories once and map the rows back through their codes
+def _sanitise_categorical(series: pl.Series) -> pl.Series:
+    categories = series.cat.get_categories()
+    if not categories.str.contains(CONTROL_CHARACTERS).any():
+        return series
+
+    # Codes index the global cache rather than this column's categories when the string cache is on
+    if pl.using_string_cache():
+        return series.cast(pl.Utf8).str.replace_all(CONTROL_CHARACTERS, " ").cast(pl.Categorical)
+    return categories.str.replace_all(CONTROL_CHARACTERS, " ").cast(pl.Categorical) \
+        .gather(series.to_physical()).alias(series.name)
+
+
+def sanitise(res_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Replaces tab and newline characters with a space. A single contains scan picks out the Utf8 columns that carry
+    any, only those are rewritten; Categoricals are cleaned through their categories instead of per row.
+    """
+    text_columns = [col for col, dtype in res_df.schema.items() if dtype == pl.Utf8]
+    if text_columns:
+        dirty = res_df.select([pl.col(col).str.contains(CONTROL_CHARACTERS).any() for col in text_columns]).row(0)
+        res_df = res_df.with_columns([pl.col(col).str.replace_all(CONTROL_CHARACTERS, " ")
+                                      for col, is_dirty in zip(text_columns, dirty) if is_dirty])
+
+    categorical_columns = [col for col, dtype in res_df.schema.items() if dtype == pl.Categorical]
+    if categorical_columns:
+        res_df = res_df.with_columns([_sanitise_categorical(res_df[col]) for col in categorical_columns])
+
+    return res_df
+
+
+# Cast, filter and strip a single fetched batch
+def process_batch(res_df: pl.DataFrame, data_types: Dict[str, pl.DataType], filter_column: str, date_start,
+                  date_end) -> pl.DataFrame:
+    # Apply column type casting
+    res_df = res_df.with_columns([pl.col(col).cast(dtype) for col, dtype in data_types.items()])
+
+    # Apply date filtering, only a verification step when the time predicate was pushed into the sql
+    res_df = res_df.filter((pl.col(filter_column) >= date_start) & (pl.col(filter_column) <= date_end))
+
+    # Remove accessory filter column if it's the last one
+    if res_df.columns[-1] == filter_column:
+        res_df = res_df.drop([filter_column])
+
+    # Remove tab and newline characters
+    return sanitise(res_df)
@@ -0,0 +1,73 @@
+# External
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+
+# Split an id range into the same [start, end] windows walked by retrieve_and_process_data
+def id_windows(id_start: int, id_end: int, batch_size: int) -> List[Tuple[int, int]]:
+    windows = []
+    while id_start < id_end:
+        max_id = min(id_start + batch_size, id_end)
+        windows.append((id_start, max_id))
+        id_start = min(max_id + 1, id_end)
+
+    return windows
+
+
+class AdaptiveBatchSize:
+    """
+    Sizes the next TreatmentID window from the ones already fetched. Row density per id varies widely between
+    tables (TreatmentProduct fans out, Treatment has one row per id), so the window grows toward a target latency and
+    shrinks to keep a single window's frame under a memory budget. windows() can be drawn on a fetch thread while
+    observe() runs on the writer, the shared state is locked. In a pipeline the size then trails by the windows
+    already queued between the two.
+    """
+    def __init__(self, batch_size: int = 100000, target_seconds: float = 60.0, max_bytes: int = 512 * 1024 ** 2,
+                 min_size: int = 1000, max_size: int = 5000000, smoothing: float = 0.5):
+        self.batch_size = batch_size
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.smoothing = smoothing
+        self.rows_per_second: Optional[float] = None
+        self._seconds_per_id: Optional[float] = None
+        self._bytes_per_id: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _smooth(self, previous: Optional[float], current: float) -> float:
+        return current if previous is None else self.smoothing * current + (1 - self.smoothing) * previous
+
+    def observe(self, window: Tuple[int, int], rows: int, nbytes: int, seconds: float):
+        """
+        Feed back a finished window, sets the size of the next one
+        :param window: (start id, end id) that was fetched
+        :param rows: rows returned for the window
+        :param nbytes: in memory size of the window's frame
+        :param seconds: execute plus fetch time
+        """
+        with self._lock:
+            ids = max(window[1] - window[0], 1)
+            self.rows_per_second = rows / seconds if seconds > 0 else None
+            self._seconds_per_id = self._smooth(self._seconds_per_id, seconds / ids)
+            self._bytes_per_id = self._smooth(self._bytes_per_id, nbytes / ids)
+
+            size = self.target_seconds / self._seconds_per_id if self._seconds_per_id > 0 else self.max_size
+            # Grow at most twice per window so a single fast window can't swing the size
+            size = min(size, self.batch_size * 2)
+            # Memory budget always wins, shrinking is not capped
+            if self._bytes_per_id > 0:
+                size = min(size, self.max_bytes / self._bytes_per_id)
+
+            self.batch_size = int(min(max(size, self.min_size), self.max_size))
+
+    def windows(self, id_start: int, id_end: int) -> Iterator[Tuple[int, int]]:
+        """
+        Same stepping as id_windows, each window is sized when it is drawn
+        """
+        while id_start < id_end:
+            with self._lock:
+                batch_size = self.batch_size
+            max_id = min(id_start + batch_size, id_end)
+            yield id_start, max_id
+            id_start = min(max_id + 1, id_end)
@@ -0,0 +1,138 @@
+# External
+import os
+import zipfile
+from enum import Enum
+
+import polars as pl
+
+
+class OutputFormat(Enum):
+    Csv = "zip"  # Zipped semicolon separated csv, what downstream consumers expect
+    Parquet = "parquet"  # zstd Parquet, one row group per id window
+    ArrowIpc = "arrows"  # zstd Arrow IPC stream, one record batch per id window
+
+
+# Build the export path for a table and date range
+def export_path(i: str, date_start, date_end, suffix: str = "", extension: str = "zip") -> str:
+    title_start, title_end = date_start.strftime("%Y-%m-%d"), date_end.strftime("%Y-%m-%d")
+    return f"./TreatmentExport/{i}/{i}_{title_start}_to_{title_end}{suffix}.{extension}"
+
+
+class BatchWriter:
+    """
+    Output sink that receives processed batches one at a time, so peak memory is bounded by a single batch
+    """
+    path: str
+    rows_written: int
+    batches_written: int
+    bytes_written: int  # In memory size of the batches, against the file size for the compression ratio
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows_written = 0
+        self.batches_written = 0
+        self.bytes_written = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, batch: pl.DataFrame):
+        self._write(batch)
+        self.rows_written += len(batch)
+        self.batches_written += 1
+        self.bytes_written += batch.estimated_size()
+
+    def _write(self, batch: pl.DataFrame):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class CsvZipBatchWriter(BatchWriter):
+    """
+    Streams batches as semicolon separated CSV straight into a zip entry, no uncompressed copy touches the disk
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        csv_name = os.path.basename(path[:-len(".zip")] if path.endswith(".zip") else path) + ".csv"
+        self._zipf = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        # Size is unknown up front, zip64 keeps entries over 2GB valid
+        self._entry = self._zipf.open(csv_name, 'w', force_zip64=True)
+
+    def _write(self, batch: pl.DataFrame):
+        # Header is only written with the first batch
+        batch.write_csv(self._entry, separator=";", quote_style="necessary", include_header=self.batches_written == 0)
+
+    def close(self):
+        if self._zipf is None:
+            return
+        self._entry.close()
+        self._zipf.close()
+        self._entry, self._zipf = None, None
+
+
+class ParquetBatchWriter(BatchWriter):
+    """
+    Writes every batch as its own zstd Parquet row group, keeping the narrowed column types
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._writer = None
+
+    def _write(self, batch: pl.DataFrame):
+        import pyarrow.parquet as pq
+
+        table = batch.to_arrow()
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+        self._writer.write_table(table, row_group_size=max(len(table), 1))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ArrowIpcBatchWriter(BatchWriter):
+    """
+    Writes every batch to a zstd Arrow IPC stream, the stream format allows each batch its own categorical dictionary
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._sink = None
+        self._writer = None
+
+    def _write(self, batch: pl.DataFrame):
+        import pyarrow as pa
+
+        table = batch.to_arrow()
+        if self._writer is None:
+            self._sink = pa.OSFile(self.path, "wb")
+            self._writer = pa.ipc.new_stream(self._sink, table.schema,
+                                             options=pa.ipc.IpcWriteOptions(compression="zstd"))
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+            self._writer, self._sink = None, None
+
+
+# Open a streaming sink for a table and date range
+def open_writer(i: str, date_start, date_end, suffix: str = "",
+                output_format: OutputFormat = OutputFormat.Csv) -> BatchWriter:
+    path = export_path(i, date_start, date_end, suffix, output_format.value)
+    if output_format == OutputFormat.Parquet:
+        return ParquetBatchWriter(path)
+    elif output_format == OutputFormat.ArrowIpc:
+        return ArrowIpcBatchWriter(path)
+    return CsvZipBatchWriter(path)
@@ -1,10 +1,9 @@
 from __future__ import annotations
 # External
 from enum import Enum
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import polars as pl
 import datetime as dt
-from pathlib import Path
 import pymssql
 from functools import reduce
 
@@ -12,6 +11,9 @@ from polars import Expr
 
 # Internal
 from src.models.connector import SqlServerConnection, ConnectionType
+from src.export.metrics import time_it
+from src.interfaces.keys import inventory_keys, journey_keys, render_keys, with_keys
+from src.interfaces.route_cache import QueryWindow, RouteCache, as_day
 
 
 class Context(Enum):
@@ -28,6 +30,7 @@ class NewSkiesConnector:
     _connection: pymssql.Connection | None = None
     _cursor: pymssql.Cursor | None = None
     _force_load: bool
+    _route_cache: RouteCache
 
     # Core Data
     _raw_data: pl.DataFrame | None  # Raw Customer Journey Data pulled from Database
@@ -35,7 +38,8 @@ class NewSkiesConnector:
     def __init__(self, airline_code: str, airline_non_standard_fares: List[str], airline_organization_codes: List[str],
                  origin: str, destination: str,
                  start: dt.date = dt.date.today(),
-                 end: dt.date = (dt.datetime.utcnow().today() + dt.timedelta(days=180)), force_load=False):
+                 end: dt.date = (dt.datetime.utcnow().today() + dt.timedelta(days=180)), force_load=False,
+                 route_cache: RouteCache | None = None):
 
 
         # Assign Attributes
@@ -43,6 +47,8 @@ class NewSkiesConnector:
             self._destination, self._start, self._end, self._force_load \
             = airline_code, airline_non_standard_fares, airline_organization_codes, \
             origin, destination, start, end, force_load,
+        # Shared between connectors so overlapping routes and date windows reuse the same day partitions
+        self._route_cache = route_cache if route_cache is not None else RouteCache()
         self._initialize_driver()
 
     def _initialize_driver(self):
@@ -58,8 +64,8 @@ class NewSkiesConnector:
     # Exposed methods ------------------------------------------------------------------------------------------------ #
     def initialize_datasets(self, save_to_local: bool = True):
         print("Getting Data ------------------ #")
-        self._pull_raw(save_to_csv=save_to_local)
-        self._pull_inventory(save_to_csv=save_to_local)
+        self._pull_raw(save_to_local=save_to_local)
+        self._pull_inventory(save_to_local=save_to_local)
         print("Done")
         print("Generating journey profile")
         # print("flight_inspect", self._raw_data.filter(
@@ -85,124 +91,189 @@ class NewSkiesConnector:
         return self._generate_flight_forecast_view()
 
     def dataset_print(self):
+        # Keys printed in their string form, the hashes are meaningless to read
         with pl.Config(tbl_cols=-1, fmt_str_lengths=100, tbl_width_chars=350):
-            print("RawData: ", self._raw_data)
-            print("JourneyProfile: ", self._journey_profile)
+            print("RawData: ", render_keys(self._raw_data, journey_keys))
+            print("JourneyProfile: ", render_keys(self._journey_profile,
+                                                  {"JourneyKey": journey_keys["JourneyKey"]}))
             print("Indirect: ", self._indirect)
             print("Group:", self._group)
 
+    @classmethod
+    def pull_routes(cls, routes: List[Tuple[str, str]], start: dt.date, end: dt.date,
+                    context: Context = Context.PassengerJourney, route_cache: RouteCache | None = None,
+                    force_load=False) -> Dict[Tuple[str, str], pl.DataFrame]:
+        """
+        Pulls many O&D pairs at once. Routes go to the server in a #Routes temp table, one query per distinct missing
+        day range instead of one per route. Results land in the route cache, so connectors built for these routes
+        afterwards initialize from it.
+        :param routes: (origin, destination) pairs
+        :return: Per route frames, the same rows each route's own pull returns
+        """
+        route_cache = route_cache if route_cache is not None else RouteCache()
+        window = cls._core_query_window if context == Context.PassengerJourney else cls._inventory_query_window
+        first_day, last_day = window.complete_days(as_day(start), as_day(end))
+
+        # Routes missing the same days share a query
+        missing: Dict[Tuple[dt.date, dt.date], List[Tuple[str, str]]] = {}
+        for origin, destination in routes:
+            for day_range in [(window.partition(first_day)[0], window.partition(last_day)[1])] if force_load else \
+                    route_cache.missing(context.name, origin, destination, window, first_day, last_day):
+                missing.setdefault(day_range, []).append((origin, destination))
+
+        for (missing_start, missing_end), missing_routes in missing.items():
+            lower_param, upper_param = window.params_for(missing_start, missing_end)
+            print(f"Pulling {len(missing_routes)} routes {context.name} for {missing_start} to {missing_end}")
+            res_df = cls._fetch_routes(context, missing_routes, lower_param, upper_param)
+            pulled_start, pulled_end = window.complete_days(lower_param, upper_param)
+            partitions = res_df.partition_by(["RouteOrigin", "RouteDestination"], as_dict=True, include_key=False)
+            for origin, destination in missing_routes:
+                route_cache.store(context.name, origin, destination, window,
+                                  partitions.get((origin, destination), res_df.drop(["RouteOrigin", "RouteDestination"])
+                                                 .clear()),
+                                  pulled_start, pulled_end, cls._route_filter(context, origin, destination),
+                                  overwrite=force_load)
+
+        keys = journey_keys if context == Context.PassengerJourney else inventory_keys
+        return {(origin, destination): with_keys(route_cache.load(context.name, origin, destination, window,
+                                                                  first_day, last_day), keys)
+                for origin, destination in routes}
+
     # Data pull methods ---------------------------------------------------------------------------------------------- #
     # Pull raw data
     @time_it
-    def _pull_raw(self, save_to_csv: bool = True) -> pl.DataFrame:
+    def _pull_raw(self, save_to_local: bool = True) -> pl.DataFrame:
         """
         Bookings + Bookings Passenger + Bookings Baggage + Passenger Journey Segment + Passenger Journey Leg
         + Passenger Journey SSR
         :return: Combination of Bookings + Bookings Passenger + Bookings Baggage
         """
         print("Fetching Passenger Journey Data")
+        if not save_to_local:
+            res_df = self._fetch_raw(self._start, self._end)
+        else:
+            # Served from the day partitions already pulled, only missing days go to the database
+            res_df = self._route_cache.get(Context.PassengerJourney.name, self._origin, self._destination,
+                                           self._core_query_window, self._start, self._end, self._fetch_raw,
+                                           self._route_filter(Context.PassengerJourney, self._origin,
+                                                              self._destination),
+                                           self._force_load)
+
+        # Journey per passenger per booking Keys and Flight Level Keys, hashed once the frame is in memory
+        self._raw_data = with_keys(res_df, journey_keys)
+        return self._raw_data
+
+    def _fetch_raw(self, date_lower: dt.date, date_upper: dt.date) -> pl.DataFrame:
+        """
+        Runs core_query for the route, passengers flying it from date_lower to date_upper plus the query padding
+        """
         query_date_format = '%d/%b/%y'
-        save_date_format = '%d-%b-%y'
-        save_name = f"{self._origin}to{self._destination}.{self._start.strftime(save_date_format)}to" \
-                    f"{self._end.strftime(save_date_format)}"
-
-        # Check if model exists, skip if force load is enabled
-        if self._file_exists(save_name) and not self._force_load:
-            print("Version exists in memory... reading from memory")
-            self._raw_data = self._read_csv(save_name, Context.PassengerJourney)
-            return self._raw_data
-
         self._initialize_driver()
         # Fetch data
         self._cursor.execute(self.core_query, (self._origin, self._destination,
-                                               self._end.strftime(query_date_format),
-                                               self._start.strftime(query_date_format)
+                                               date_upper.strftime(query_date_format),
+                                               date_lower.strftime(query_date_format)
                                                ))
         res = self._cursor.fetchall()
         # Convert dictionaries to pandas dataframe
         res_df = pl.DataFrame(res, schema=self._schema)
         self._close_driver()
 
-        # Add standardized keys, these are FlightCodes Journey per passenger per booking Keys and Flight Level Keys
+        return self._prepare_raw(res_df)
+
+    @classmethod
+    def _prepare_raw(cls, res_df: pl.DataFrame) -> pl.DataFrame:
+        # Add standardized FlightCodes, the composite keys are hashed from them after loading (see keys.py)
         res_df = res_df.with_columns(pl.concat_str([pl.col("CarrierCode"), pl.col("FlightNumber")]).alias("FlightCode")
                                      .str.strip_chars())
-        res_df = res_df.with_columns(pl.concat_str([pl.col("BookingID"), pl.col("PassengerID"), pl.col("SegmentID"),
-                                                    pl.col("TripNumber"), pl.col("JourneyNumber"),
-                                                    pl.col("SegmentNumber"),
-                                                    pl.col("LegNumber")]).str.strip_chars().alias("Key"),
-                                     pl.concat_str([pl.col("BookingID"), pl.col("PassengerID"),
-                                                    pl.col("TripNumber"), pl.col("JourneyNumber")])
-                                     .str.strip_chars().alias("JourneyKey"), pl.concat_str([pl.col("STDUTC"),
-                                                                                            pl.col(
-                                                                                                "DepartureStationLeg"),
-                                                                                            pl.col("ArrivalStationLeg"),
-                                                                                            pl.col("FlightCode")],
-                                                                                           separator=".")
-                                     .str.strip_chars().alias("FlightKey"))
 
         # Bind Inventory Departure and Passenger Lift Status
-        res_df = self.bind_inventory_status(
-            self.bind_inventory_departure_status(self.bind_passenger_lift_status(res_df)))
-
-        # Save as class attribute
-        self._raw_data = res_df
+        res_df = cls.bind_inventory_status(
+            cls.bind_inventory_departure_status(cls.bind_passenger_lift_status(res_df)))
 
-        # Optionally save as CSV
-        if save_to_csv:
-            self._write_csv(res_df, save_name)
         return res_df
 
     # Pull raw data
     @time_it
-    def _pull_inventory(self, save_to_csv: bool = True) -> pl.DataFrame:
+    def _pull_inventory(self, save_to_local: bool = True) -> pl.DataFrame:
         """
         Passenger Journey Leg + Inventory + Inventory Nest
         :return: Combination of Bookings + Bookings Passenger + Bookings Baggage
         """
         print("Fetching Inventory Data")
+        if not save_to_local:
+            res_df = self._fetch_inventory(self._start, self._end)
+        else:
+            # Served from the month partitions already pulled, only missing months go to the database
+            res_df = self._route_cache.get(Context.Inventory.name, self._origin, self._destination,
+                                           self._inventory_query_window, self._start, self._end,
+                                           self._fetch_inventory,
+                                           self._route_filter(Context.Inventory, self._origin, self._destination),
+                                           self._force_load)
+
+        # Flight Level Keys, hashed once the frame is in memory
+        self._raw_inventory_data = with_keys(res_df, inventory_keys)
+        return self._raw_inventory_data
+
+    def _fetch_inventory(self, date_lower: dt.date, date_upper: dt.date) -> pl.DataFrame:
+        """
+        Runs inventory_query for the route, passengers flying it from date_lower to date_upper plus the query padding
+        """
         query_date_format = '%d/%b/%y'
-        save_date_format = '%d-%b-%y'
-        save_name = f"inventory_{self._origin}to{self._destination}.{self._start.strftime(save_date_format)}to" \
-                    f"{self._end.strftime(save_date_format)}"
-
-        # Check if model exists, skip if force load is enabled
-        if self._file_exists(save_name) and not self._force_load:
-            print("Version exists in memory... reading from memory")
-            self._raw_inventory_data = self._read_csv(save_name, Context.Inventory)
-            return self._raw_inventory_data
-
         self._initialize_driver()
         # Fetch data
         self._cursor.execute(self.inventory_query, (self._origin, self._destination,
-                                                    self._end.strftime(query_date_format),
-                                                    self._start.strftime(query_date_format)
+                                                    date_upper.strftime(query_date_format),
+                                                    date_lower.strftime(query_date_format)
                                                     ))
         res = self._cursor.fetchall()
         # Convert dictionaries to pandas dataframe
         res_df = pl.DataFrame(res, schema=self._inventory_schema)
         self._close_driver()
 
-        # Add standardized keys, these are FlightCodes Journey per passenger per booking Keys and Flight Level Keys
+        return self._prepare_inventory(res_df)
+
+    @classmethod
+    def _prepare_inventory(cls, res_df: pl.DataFrame) -> pl.DataFrame:
+        # Add standardized FlightCodes, the composite keys are hashed from them after loading (see keys.py)
         res_df = res_df.with_columns(pl.concat_str([pl.col("CarrierCode"), pl.col("FlightNumber")]).alias("FlightCode")
                                      .str.strip_chars())
-        res_df = res_df.with_columns(pl.concat_str([pl.col("STDUTC"), pl.col("DepartureStation"),
-                                                    pl.col("ArrivalStation"),
-                                                    pl.col("FlightCode")],
-                                                   separator=".")
-                                     .str.strip_chars().alias("FlightKey"))
 
         # Bind Inventory Departure and Passenger Lift Status
-        res_df = self.bind_inventory_status(
-            self.bind_inventory_departure_status(self.bind_passenger_lift_status(res_df)))
-
-        # Save as class attribute
-        self._raw_inventory_data = res_df
+        res_df = cls.bind_inventory_status(
+            cls.bind_inventory_departure_status(cls.bind_passenger_lift_status(res_df)))
 
-        # Optionally save as CSV
-        if save_to_csv:
-            self._write_csv(res_df, save_name)
         return res_df
 
+    @classmethod
+    def _fetch_routes(cls, context: Context, routes: List[Tuple[str, str]], date_lower: dt.date,
+                      date_upper: dt.date) -> pl.DataFrame:
+        """
+        Set based pull of several routes on one connection, rows carry RouteOrigin / RouteDestination of the route
+        their passenger qualified on. A passenger on more than one route comes back once per route.
+        """
+        query_date_format = '%d/%b/%y'
+        connection = SqlServerConnection(ConnectionType.NewSkies).connect()
+        cursor = connection.cursor(as_dict=True)
+        try:
+            cursor.execute("CREATE TABLE #Routes ([Origin] VARCHAR(10), [Destination] VARCHAR(10))")
+            # INSERT ... VALUES takes at most 1000 rows
+            for ix in range(0, len(routes), 1000):
+                chunk = routes[ix:ix + 1000]
+                cursor.execute("INSERT INTO #Routes VALUES " + ", ".join(["(%s, %s)"] * len(chunk)),
+                               tuple(station for route in chunk for station in route))
+            cursor.execute(cls._routes_query(cls.core_query if context == Context.PassengerJourney else
+                                             cls.inventory_query),
+                           (date_upper.strftime(query_date_format), date_lower.strftime(query_date_format)))
+            res = cursor.fetchall()
+        finally:
+            connection.close()
+
+        route_schema = {"RouteOrigin": pl.String, "RouteDestination": pl.String}
+        if context == Context.PassengerJourney:
+            return cls._prepare_raw(pl.DataFrame(res, schema={**cls._schema, **route_schema}))
+        return cls._prepare_inventory(pl.DataFrame(res, schema={**cls._inventory_schema, **route_schema}))
+
     # Data Augmentation Methods -------------------------------------------------------------------------------------- #
     # Generate Journey Booking Profile
     def _generate_journey_booking_profile(self) -> pl.DataFrame:
@@ -244,14 +315,14 @@ class NewSkiesConnector:
     # Boost Views ---------------------------------------------------------------------------------------------------- #
 
     def _generate_wtp_valid_trips(self):
-        # Filter by aggregate filters
-        target_flights = self._journey_profile.filter(
+        # Filter by aggregate filters, booking rows of the target journeys
+        target_booking_rows = self._journey_profile.lazy().filter(
             self._generate_filters()
-        )
+        ).select(pl.col("Key").explode()).unique().with_columns(pl.lit(True).alias("Target"))
 
         # Filtered Data
         # Filter Trips ## **
-        valid_trips = self._raw_data.filter((pl.col("STDUTC") >= self._start)
+        valid_trips = self._raw_data.lazy().filter((pl.col("STDUTC") >= self._start)
                                             & (pl.col("STDUTC") <= self._end) &  # Departure Data Range
                                             (pl.col("DepartureStation") == self._origin) &  # Origin Specification
                                             (pl.col("ArrivalStation") == self._destination) &  # Arrival Specification
@@ -261,22 +332,26 @@ class NewSkiesConnector:
         if self._filter_config["FlightStandardAirlineFares"]:
             valid_trips.filter(~pl.col("ClassOfService").is_in(self._airline_non_standard_fares))
 
-        target_booking_rows = target_flights.select(pl.col("Key").explode()).get_column("Key").unique()
+        # Flag every booking row against the target journeys in one left join, rows without a key match neither side
+        flagged_trips = valid_trips.filter(pl.col("Key").is_not_null()) \
+            .join(target_booking_rows, on="Key", how="left")
 
         # Positive Flights
-        filtered_data_airline = valid_trips.filter((pl.col("Key").is_in(
-            target_booking_rows.to_list())))  # Filter Relevant Booking Rows
+        filtered_data_airline = flagged_trips.filter(pl.col("Target").is_not_null()).drop("Target")
 
         # BY ANY MEANS DO NOT USE THIS, THIS PART OF THE CODE HAS REGRESSED TO GET STUFF ACROSS,
         # THIS IS A LOW PRIORITY
         # Negative Flights
-        filtered_data_others = valid_trips.filter(~pl.col("Key").is_in(filtered_data_airline.get_column("Key"))) \
+        filtered_data_others = flagged_trips.filter(pl.col("Target").is_null()) \
             .group_by(["FlightKey"]).agg(pl.col("FlightKey").count().alias("LidAdjustment"))
 
+        # Both sides share the flagged plan, collected together it runs once
+        filtered_data_airline, filtered_data_others = pl.collect_all([filtered_data_airline, filtered_data_others])
+
         # with pl.Config(tbl_cols=-1, tbl_rows=50, fmt_str_lengths=100, tbl_width_chars=350):
         #     print("filtered_data", filtered_data_airline)
 
-        self._boost_wtp_valid_store = {"target": filtered_data_airline, "others": []}  # <- I never use this
+        self._boost_wtp_valid_store = {"target": filtered_data_airline, "others": filtered_data_others}
 
     # Infare View
     def _generate_effective_navitaire_multi_bookings_view(self) -> pl.DataFrame:
@@ -503,24 +578,6 @@ class NewSkiesConnector:
         return flight_forecast
 
     # Helper Function ------------------------------------------------------------------------------------------------ #
-    @staticmethod
-    def _write_csv(data: pl.DataFrame, name: str):
-        Path("./data/bookings").mkdir(parents=True, exist_ok=True)
-        print(f"Saving to {name}.csv")
-        data.write_csv(f"./data/bookings/{name}.csv")
-
-    @staticmethod
-    def _file_exists(name: str) -> bool:
-        if not Path(f"./data/bookings/{name}.csv").is_file():
-            return False
-        else:
-            return True
-
-    def _read_csv(self, name: str, context: Context) -> pl.DataFrame:
-        return pl.read_csv(f"./data/bookings/{name}.csv",
-                           schema=self._read_schema if context == Context.PassengerJourney else
-                           self._read_inventory_schema)
-
     @staticmethod
     def is_valid_journey_chain(df: pl.DataFrame):
         """
@@ -529,14 +586,53 @@ class NewSkiesConnector:
         shifted_departures = df["DepartureStation"].shift(-1)
         return (shifted_departures[:-1] == df["ArrivalStation"][:-1]).all()
 
-    def bind_passenger_lift_status(self, data: pl.DataFrame) -> pl.DataFrame:
-        return data.join(self._lift_status, on="LiftStatus")
+    @classmethod
+    def bind_passenger_lift_status(cls, data: pl.DataFrame) -> pl.DataFrame:
+        return data.join(cls._lift_status, on="LiftStatus")
 
-    def bind_inventory_departure_status(self, data: pl.DataFrame) -> pl.DataFrame:
-        return data.join(self._departure_status, on="DepartureStatus")
+    @classmethod
+    def bind_inventory_departure_status(cls, data: pl.DataFrame) -> pl.DataFrame:
+        return data.join(cls._departure_status, on="DepartureStatus")
 
-    def bind_inventory_status(self, data: pl.DataFrame) -> pl.DataFrame:
-        return data.join(self._inventory_status, on="Status")
+    @classmethod
+    def bind_inventory_status(cls, data: pl.DataFrame) -> pl.DataFrame:
+        return data.join(cls._inventory_status, on="Status")
+
+    @staticmethod
+    def _route_filter(context: Context, origin: str, destination: str) -> Expr:
+        """
+        Rows on the route itself, the legs a passenger was pulled for
+        """
+        if context == Context.PassengerJourney:
+            return (pl.col("DepartureStationLeg") == origin) & (pl.col("ArrivalStationLeg") == destination)
+        return (pl.col("DepartureStation") == origin) & (pl.col("ArrivalStation") == destination)
+
+    @staticmethod
+    def _routes_query(sql_query: str) -> str:
+        """
+        Set based variant of core_query / inventory_query, the route filter joins a #Routes temp table and the route
+        is carried through to the output. Only the date parameters remain.
+        """
+        replacements = [
+            ("    DECLARE @Origin as VARCHAR(10) = %s\n    DECLARE @Destination as VARCHAR(10) = %s\n", ""),
+            ("SELECT DISTINCT pjl.[PassengerID] FROM", "SELECT DISTINCT pjl.[PassengerID], r.[Origin] AS RouteOrigin, "
+                                                       "r.[Destination] AS RouteDestination FROM"),
+            ("SELECT bp.[PassengerID] FROM", "SELECT bp.[PassengerID], r.[Origin] AS RouteOrigin, "
+                                             "r.[Destination] AS RouteDestination FROM"),
+            ("AND il.[DepartureStation] = @Origin AND il.[ArrivalStation] = @Destination",
+             "INNER JOIN #Routes r ON il.[DepartureStation] = r.[Origin] AND il.[ArrivalStation] = r.[Destination]"),
+            ("SELECT b.FirstName, b.CreatedUTC, b.BookingID, b.RecordLocator, pj.* ",
+             "SELECT b.FirstName, b.CreatedUTC, b.BookingID, b.RecordLocator, pj.*, bfl.RouteOrigin, "
+             "bfl.RouteDestination "),
+            ("SELECT pjl.*\n", "SELECT pjl.*, b.RouteOrigin, b.RouteDestination\n"),
+        ]
+        for old, new in replacements:
+            sql_query = sql_query.replace(old, new)
+        # Every route reference has to be gone, a query edited out of step with this would filter on nothing
+        if "@Origin" in sql_query or "@Destination" in sql_query or "RouteOrigin" not in sql_query:
+            raise ValueError("query no longer matches the route filter it is rewritten from")
+
+        return sql_query
 
     # Helper Variables ----------------------------------------------------------------------------------------------- #
     _schema = {
@@ -553,21 +649,6 @@ class NewSkiesConnector:
         "Lid": pl.Int32
     }
 
-    _read_schema = {
-        "FirstName": pl.String, "CreatedUTC": pl.Datetime, "BookingID": pl.String, "RecordLocator": pl.String,
-        "PassengerID": pl.String, "SegmentID": pl.String, "Compartment": pl.String, "FareBasis": pl.String,
-        "ClassOfService": pl.String,
-        "SourceDomainName": pl.String, "SourceDomainCode": pl.String, "SourceOrganizationName": pl.String,
-        "SourceOrganizationCode": pl.String, "DepartureStation": pl.String, "ArrivalStation": pl.String,
-        "TripNumber": pl.Int32, "JourneyNumber": pl.Int32, "SegmentNumber": pl.Int32, "CreatedLocationCode": pl.String,
-        "LegNumber": pl.Int32, "STDUTC": pl.Datetime, "STD": pl.Datetime, "STAUTC": pl.Datetime, "STA": pl.Datetime,
-        "CarrierCode": pl.String, "FlightNumber": pl.String, "OperatingFlightNumber": pl.String, "Status": pl.Int32,
-        "DepartureStatus": pl.Int32, "DepartureStationLeg": pl.String, "ArrivalStationLeg": pl.String,
-        "BookingStatus": pl.String, "LiftStatus": pl.Int32, "Capacity": pl.Int32, "AdjustedCapacity": pl.Int32,
-        "Lid": pl.Int32, "FlightCode": pl.String, "Key": pl.String, "JourneyKey": pl.String, "FlightKey": pl.String,
-        "PassengerStatus": pl.String, "FlightStatus": pl.String, "InventoryStatus": pl.String
-    }
-
     _inventory_schema = {
         "PassengerID": pl.String, "SegmentID": pl.String, "Compartment": pl.String,
         "STDUTC": pl.Datetime, "STD": pl.Datetime, "STAUTC": pl.Datetime, "STA": pl.Datetime, "LegNumber": pl.Int32,
@@ -577,17 +658,6 @@ class NewSkiesConnector:
         "Lid": pl.Int32, "TravelClassCode": pl.String, "ClassLid": pl.String, "ClassAdjustedCapacity": pl.String
     }
 
-    _read_inventory_schema = {
-        "PassengerID": pl.String, "SegmentID": pl.String, "Compartment": pl.String,
-        "STDUTC": pl.Datetime, "STD": pl.Datetime, "STAUTC": pl.Datetime, "STA": pl.Datetime, "LegNumber": pl.Int32,
-        "FlightNumber": pl.String, "OperatingFlightNumber": pl.String, "Status": pl.Int32, "DepartureStatus": pl.Int32,
-        "DepartureStation": pl.String, "ArrivalStation": pl.String, "CarrierCode": pl.String,
-        "BookingStatus": pl.String, "LiftStatus": pl.Int32, "Capacity": pl.Int32, "AdjustedCapacity": pl.Int32,
-        "Lid": pl.Int32, "TravelClassCode": pl.String, "ClassLid": pl.String, "ClassAdjustedCapacity": pl.String,
-        "FlightCode": pl.String, "FlightKey": pl.String, "PassengerStatus": pl.String, "FlightStatus": pl.String,
-        "InventoryStatus": pl.String
-    }
-
     def _get_indirect_journeys(self) -> pl.DataFrame:
         """
         Get Indirect Journeys against a passenger in a booking
@@ -681,6 +751,10 @@ class NewSkiesConnector:
     )
 
     # SQL Snippets --------------------------------------------------------------------------------------------------- #
+    # Padding each query applies around its date parameters, keep in step with the DATEADD lines below
+    _core_query_window = QueryWindow(days=1)
+    _inventory_query_window = QueryWindow(months=14)
+
     core_query = """
     DECLARE @Origin as VARCHAR(10) = %s
     DECLARE @Destination as VARCHAR(10) = %s
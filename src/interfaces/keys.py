@@ -0,0 +1,39 @@
+# External
+from typing import Dict, List, Tuple
+
+import polars as pl
+
+# Fixed so keys hashed in separate frames (journey legs, inventory) line up in joins
+KEY_SEED = 0
+
+# Parts of each composite key and the separator of its string form
+journey_keys: Dict[str, Tuple[List[str], str]] = {
+    "Key": (["BookingID", "PassengerID", "SegmentID", "TripNumber", "JourneyNumber", "SegmentNumber", "LegNumber"], ""),
+    "JourneyKey": (["BookingID", "PassengerID", "TripNumber", "JourneyNumber"], ""),
+    "FlightKey": (["STDUTC", "DepartureStationLeg", "ArrivalStationLeg", "FlightCode"], "."),
+}
+inventory_keys: Dict[str, Tuple[List[str], str]] = {
+    "FlightKey": (["STDUTC", "DepartureStation", "ArrivalStation", "FlightCode"], "."),
+}
+
+
+def hash_key(columns: List[str]) -> pl.Expr:
+    """
+    UInt64 hash of the key parts, joins and unique() on it skip hashing long strings row by row. Null when any part
+    is null like the concatenated string it replaces. Only stable within a polars version, so keys are derived after
+    loading and never persisted.
+    """
+    return pl.when(pl.any_horizontal([pl.col(col).is_null() for col in columns])).then(None) \
+        .otherwise(pl.struct(columns).hash(KEY_SEED))
+
+
+def with_keys(data: pl.DataFrame, keys: Dict[str, Tuple[List[str], str]]) -> pl.DataFrame:
+    return data.with_columns([hash_key(columns).alias(name) for name, (columns, _) in keys.items()])
+
+
+def render_keys(data: pl.DataFrame, keys: Dict[str, Tuple[List[str], str]]) -> pl.DataFrame:
+    """
+    Human readable string form of the keys, for exports and debugging only
+    """
+    return data.with_columns([pl.concat_str([pl.col(col) for col in columns], separator=separator).str.strip_chars()
+                             .alias(name) for name, (columns, separator) in keys.items()])
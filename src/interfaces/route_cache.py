@@ -0,0 +1,207 @@
+# External
+import calendar
+import datetime as dt
+import os
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import polars as pl
+
+
+# Same clamping as DATEADD(MONTH, ...), the 31st lands on the last day of a shorter month
+def add_months(date: dt.date, months: int) -> dt.date:
+    month = date.month - 1 + months
+    year, month = date.year + month // 12, month % 12 + 1
+    return date.replace(year=year, month=month, day=min(date.day, calendar.monthrange(year, month)[1]))
+
+
+# Calendar day of a date or datetime bound
+def as_day(date) -> dt.date:
+    return date.date() if isinstance(date, dt.datetime) else date
+
+
+class QueryWindow:
+    """
+    Padding a NewSkies query puts around its @DATELOWER / @DATEUPPER parameters before filtering il.[STD], mirrors
+    the DATEADD lines of the query. The upper bound is a DATE so only its midnight is covered, the days a pull
+    returns in full run from lower(lower_param) to upper(upper_param) - 1 day.
+    """
+
+    def __init__(self, days: int = 0, months: int = 0):
+        self.days = days
+        self.months = months
+
+    def lower(self, date: dt.date) -> dt.date:
+        return add_months(date, -self.months) - dt.timedelta(days=self.days)
+
+    def upper(self, date: dt.date) -> dt.date:
+        return add_months(date, self.months) + dt.timedelta(days=self.days)
+
+    def complete_days(self, lower_param: dt.date, upper_param: dt.date) -> Tuple[dt.date, dt.date]:
+        return self.lower(lower_param), self.upper(upper_param) - dt.timedelta(days=1)
+
+    def partition(self, day: dt.date) -> Tuple[dt.date, dt.date]:
+        """
+        First and last day of the cache partition holding day. Pulls padded by months are kept per calendar month,
+        a partition per day would run to about a thousand files for a single route.
+        """
+        if not self.months:
+            return day, day
+        return day.replace(day=1), day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+    def partitions(self, first_day: dt.date, last_day: dt.date) -> List[Tuple[dt.date, dt.date]]:
+        """
+        Partitions overlapping first_day to last_day, in order
+        """
+        res = [self.partition(first_day)]
+        while res[-1][1] < last_day:
+            res.append(self.partition(res[-1][1] + dt.timedelta(days=1)))
+        return res
+
+    def params_for(self, first_day: dt.date, last_day: dt.date) -> Tuple[dt.date, dt.date]:
+        """
+        Query parameters whose pull covers first_day to last_day in full, the smallest such window
+        """
+        lower_param = add_months(first_day, self.months) + dt.timedelta(days=self.days)
+        while self.lower(lower_param) > first_day:
+            lower_param -= dt.timedelta(days=1)
+        upper_param = add_months(last_day + dt.timedelta(days=1), -self.months) - dt.timedelta(days=self.days)
+        while self.upper(upper_param) <= last_day:
+            upper_param += dt.timedelta(days=1)
+
+        return lower_param, upper_param
+
+
+class RouteCache:
+    """
+    NewSkies pulls stored per route and qualifying departure day, the day a passenger flew the route on. Each
+    partition holds a day, or a calendar month for pulls padded by months (see QueryWindow.partition).
+    Overlapping requests are served from the partitions already on disk and only the missing ranges are pulled.
+    Partitions are Arrow IPC so reads are memory mapped, the least recently used ones are evicted once the cache
+    grows past max_bytes.
+    """
+    root: Path
+    max_bytes: int
+
+    def __init__(self, root: str = "./data/bookings", max_bytes: int = 4 * 1024 ** 3):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def _path(self, context: str, origin: str, destination: str, partition: Tuple[dt.date, dt.date]) -> Path:
+        name = partition[0].strftime('%Y-%m-%d') if partition[0] == partition[1] else partition[0].strftime('%Y-%m')
+        return self.root / context / f"{origin}to{destination}" / f"{name}.arrow"
+
+    def missing(self, context: str, origin: str, destination: str, window: QueryWindow, first_day: dt.date,
+                last_day: dt.date) -> List[Tuple[dt.date, dt.date]]:
+        """
+        Contiguous ranges of the partitions between first_day and last_day that aren't on disk, whole partitions so
+        a month range can reach past first_day and last_day
+        """
+        ranges = []
+        for partition in window.partitions(first_day, last_day):
+            if not self._path(context, origin, destination, partition).is_file():
+                if ranges and ranges[-1][1] == partition[0] - dt.timedelta(days=1):
+                    ranges[-1] = (ranges[-1][0], partition[1])
+                else:
+                    ranges.append(partition)
+
+        return ranges
+
+    def store(self, context: str, origin: str, destination: str, window: QueryWindow, data: pl.DataFrame,
+              first_day: dt.date, last_day: dt.date, qualifying: pl.Expr, overwrite: bool = False):
+        """
+        Split a pull into its partitions, those it only covers in part are left out. A passenger goes to every day
+        they flew the route on, rows without a qualifying leg (dropped by the leg join) fall back to the passenger's
+        first departure. Month partitions keep the day in a _day column.
+        :param first_day: first day the pull covers in full
+        :param last_day: last day the pull covers in full
+        :param qualifying: rows on the requested route
+        """
+        days = data.filter(qualifying).select(pl.col("PassengerID"), pl.col("STD").dt.date().alias("_day")).unique()
+        fallback = data.join(days, on="PassengerID", how="anti").group_by("PassengerID") \
+            .agg(pl.col("STD").dt.date().min().alias("_day")) \
+            .with_columns(pl.col("_day").fill_null(first_day).clip(first_day, last_day))
+        data = data.join(pl.concat([days, fallback]), on="PassengerID") \
+            .filter((pl.col("_day") >= first_day) & (pl.col("_day") <= last_day))
+
+        for partition in window.partitions(first_day, last_day):
+            path = self._path(context, origin, destination, partition)
+            if partition[0] < first_day or partition[1] > last_day or (path.is_file() and not overwrite):
+                continue
+            res_df = data.filter((pl.col("_day") >= partition[0]) & (pl.col("_day") <= partition[1]))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Partitions without bookings are written too, an empty partition still counts as pulled
+            (res_df if partition[0] < partition[1] else res_df.drop("_day")) \
+                .write_ipc(f"{path}.tmp", compression="uncompressed")
+            os.replace(f"{path}.tmp", path)
+
+    def paths(self, context: str, origin: str, destination: str, window: QueryWindow, first_day: dt.date,
+              last_day: dt.date) -> List[Path]:
+        return [self._path(context, origin, destination, partition)
+                for partition in window.partitions(first_day, last_day)]
+
+    def load(self, context: str, origin: str, destination: str, window: QueryWindow, first_day: dt.date,
+             last_day: dt.date) -> pl.DataFrame:
+        """
+        Union of the partitions, a passenger on several days is taken from the first one only
+        """
+        paths = self.paths(context, origin, destination, window, first_day, last_day)
+        for path in paths:
+            # Access time for the LRU, mtime since atime is often disabled
+            os.utime(path)
+
+        if window.months:
+            # Month partitions carry the day, trimmed to the requested days before taking the first one
+            return pl.scan_ipc(paths) \
+                .filter((pl.col("_day") >= first_day) & (pl.col("_day") <= last_day)) \
+                .filter(pl.col("_day") == pl.col("_day").min().over("PassengerID")) \
+                .drop("_day").collect()
+
+        # Partition names sort by day, the smallest path is the passenger's first day
+        return pl.scan_ipc(paths, include_file_paths="_partition") \
+            .filter(pl.col("_partition") == pl.col("_partition").min().over("PassengerID")) \
+            .drop("_partition").collect()
+
+    def evict(self, keep: Tuple[Path, ...] = ()):
+        """
+        Drop the least recently used partitions until the cache fits max_bytes
+        """
+        partitions = [(path.stat().st_mtime, path.stat().st_size, path) for path in self.root.glob("*/*/*.arrow")]
+        total = sum(size for _, size, _ in partitions)
+        for _, size, path in sorted(partitions):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                # Still mapped by a reader, left for the next eviction
+                continue
+
+    def get(self, context: str, origin: str, destination: str, window: QueryWindow, start: dt.date, end: dt.date,
+            fetch: Callable[[dt.date, dt.date], pl.DataFrame], qualifying: pl.Expr, force: bool = False) \
+            -> pl.DataFrame:
+        """
+        Same passengers as one pull of start to end, served from cached days where possible
+        :param window: padding of the query fetch runs
+        :param fetch: runs the query for a (lower, upper) parameter pair
+        :param force: pull the whole range again
+        """
+        first_day, last_day = window.complete_days(as_day(start), as_day(end))
+        missing = [(window.partition(first_day)[0], window.partition(last_day)[1])] if force else \
+            self.missing(context, origin, destination, window, first_day, last_day)
+        for missing_start, missing_end in missing:
+            lower_param, upper_param = window.params_for(missing_start, missing_end)
+            print(f"Pulling {origin}to{destination} {context} for {missing_start} to {missing_end}")
+            pulled_start, pulled_end = window.complete_days(lower_param, upper_param)
+            # Every day the pull covers in full is kept, the padding fills neighbouring requests for free
+            self.store(context, origin, destination, window, fetch(lower_param, upper_param), pulled_start,
+                       pulled_end, qualifying, overwrite=force)
+        if not missing:
+            print("Version exists in memory... reading from memory")
+
+        res_df = self.load(context, origin, destination, window, first_day, last_day)
+        self.evict(keep=tuple(self.paths(context, origin, destination, window, first_day, last_day)))
+        return res_df
@@ -2,6 +2,7 @@ from dataclasses import dataclass
 from enum import Enum
 import os
 import dotenv
+import pymssql
 from dotenv import load_dotenv
 
 
@@ -24,3 +25,6 @@ class SqlServerConnection:
         self.uri = os.environ.get(f"{connection_type.value}_URI")
         self.port = os.environ.get(f"{connection_type.value}_PORT")
         self.database = os.environ.get(f"{connection_type.value}_DATABASE")
+
+    def connect(self) -> pymssql.Connection:
+        return pymssql.connect(f"{self.uri + ':' + self.port}", self.user, self.pwd, self.database)
@@ -0,0 +1,53 @@
+# External
+import datetime as dt
+import zipfile
+
+import polars as pl
+
+# Internal
+from src.export.checkpoint import CheckpointManifest
+from src.export.combine import combine_parts
+from src.export.writers import export_path
+
+DATE_START, DATE_END = dt.datetime(2025, 1, 19), dt.datetime(2025, 1, 20)
+
+
+# One incremental refresh, writes ids past the last window into the next part like stream_all_tables
+def _refresh(manifest: CheckpointManifest, id_end: int):
+    id_start = (manifest.resume_from("Treatment", DATE_START) or 999) + 1
+    with manifest.open_writer("Treatment", DATE_START, DATE_END) as writer:
+        offset = writer.rows_written
+        writer.write(pl.DataFrame({"TreatmentID": list(range(id_start, id_end + 1))}))
+        manifest.record_window("Treatment", DATE_START, (id_start, id_end), writer.rows_written - offset, offset)
+    manifest.record_watermark("Treatment", DATE_START, id_end)
+
+
+def _combined_ids() -> list:
+    with zipfile.ZipFile(export_path("Treatment", DATE_START, DATE_END)) as zip_ref:
+        return pl.read_csv(zip_ref.read(zip_ref.namelist()[0]), separator=";")["TreatmentID"].to_list()
+
+
+def test_refresh_after_combine_does_not_duplicate_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manifest = CheckpointManifest()
+
+    _refresh(manifest, 1200)
+    _refresh(manifest, 1300)
+    combine_parts("./TreatmentExport/Treatment")
+    assert _combined_ids() == list(range(1000, 1301))
+
+    # A refresh after a combine leaves _part0 alone, the next combine sees every id once
+    _refresh(CheckpointManifest(), 1400)
+    combine_parts("./TreatmentExport/Treatment")
+    assert _combined_ids() == list(range(1000, 1401))
+
+
+def test_record_complete_combines_parts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manifest = CheckpointManifest()
+
+    _refresh(manifest, 1200)
+    manifest = CheckpointManifest()
+    _refresh(manifest, 1300)
+    manifest.record_complete("Treatment", DATE_START)
+    assert _combined_ids() == list(range(1000, 1301))